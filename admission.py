@@ -0,0 +1,89 @@
+"""Admission control for expensive routes.
+
+Each endpoint listed in ADMISSION_LIMITS may run at most ``concurrency``
+requests at once per process. Up to ``queue`` more wait for a slot for at most
+``timeout`` seconds. Requests beyond that are shed straight away with a 503 and
+a Retry-After header, so a traffic spike on /shows or the searches can't tie
+up every worker thread and pool connection. Endpoints without a limit, such
+as /, static files and the health checks, are never queued.
+"""
+
+import threading
+import time
+
+from flask import Response, g, request
+
+import metrics
+
+
+class Limiter:
+    def __init__(self, endpoint, concurrency, queue, timeout):
+        self.endpoint = endpoint
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.queue = queue
+        self.timeout = timeout
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot; returns None once admitted, else why it was shed."""
+        if self.slots.acquire(blocking=False):
+            return None
+        with self.lock:
+            if self.waiting >= self.queue:
+                return "queue_full"
+            self.waiting += 1
+        metrics.recordAdmissionWaiting(self.endpoint, 1)
+        started = time.perf_counter()
+        try:
+            admitted = self.slots.acquire(timeout=self.timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+            metrics.recordAdmissionWaiting(self.endpoint, -1)
+        metrics.recordAdmissionWait(self.endpoint, time.perf_counter() - started)
+        return None if admitted else "timeout"
+
+    def release(self):
+        self.slots.release()
+
+
+class AdmissionControl:
+    def __init__(self, app=None):
+        self.limiters = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app.config)
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def configure(self, config):
+        """Build the limiters from ADMISSION_LIMITS and ADMISSION_RETRY_AFTER."""
+        self.retryAfter = config["ADMISSION_RETRY_AFTER"]
+        self.limiters = {
+            endpoint: Limiter(endpoint, **limits)
+            for endpoint, limits in config["ADMISSION_LIMITS"].items()
+        }
+
+    def admit(self):
+        limiter = self.limiters.get(request.endpoint)
+        if limiter is None:
+            return None
+        reason = limiter.acquire()
+        if reason is not None:
+            metrics.recordShed(limiter.endpoint, reason)
+            return Response(
+                "Fyyur is busy right now, please try again shortly.\n",
+                503,
+                headers={"Retry-After": str(self.retryAfter)},
+                mimetype="text/plain",
+            )
+        g.admissionLimiter = limiter
+        return None
+
+    def release(self, exc=None):
+        limiter = g.pop("admissionLimiter", None)
+        if limiter is not None:
+            limiter.release()
@@ -2,21 +2,51 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
+import csv
+import io
 import json
+import os
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import (
+    Flask,
+    jsonify,
+    render_template,
+    request,
+    Response,
+    flash,
+    redirect,
+    url_for,
+    abort,
+    stream_with_context,
+)
 from flask_moment import Moment
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from datetime import timedelta, timezone
 from flask_migrate import Migrate
-from sqlalchemy import TypeDecorator
-from sqlalchemy.dialects.postgresql import ARRAY, ENUM
+from profiling import RequestProfiler
+import metrics
+import jobs
+import partitions
+from warmup import Readiness
+from compression import CompressionMiddleware
+from admission import AdmissionControl
+from cache import SearchCache, EntityCache, ChangeListener
+import sqlalchemy as sa
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import TypeDecorator, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import ARRAY, ENUM, insert as pgInsert
 from enum import Enum
 import re
+import sqlite3
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -27,7 +57,53 @@ moment = Moment(app)
 app.config.from_object("config")
 db = SQLAlchemy(app)
 
+
+@event.listens_for(Engine, "connect")
+def enableSqliteForeignKeys(dbapiConnection, connectionRecord):
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on
+    if isinstance(dbapiConnection, sqlite3.Connection):
+        dbapiConnection.execute("PRAGMA foreign_keys=ON")
+
+
+# Compiled templates are shared by all workers and survive restarts
+os.makedirs(app.config["TEMPLATE_CACHE_DIR"], exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["TEMPLATE_CACHE_DIR"])
+
 migrate = Migrate(app, db)
+metrics.init_app(app)
+profiler = RequestProfiler(app)
+if app.config["ADMISSION_ENABLED"]:
+    admission = AdmissionControl(app)
+partitions.init_app(app, db)
+readiness = Readiness(app, db)
+if app.config["COMPRESSION_ENABLED"]:
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        types=app.config["COMPRESSION_TYPES"],
+        minSize=app.config["COMPRESSION_MIN_SIZE"],
+    )
+searchCache = SearchCache(
+    ttl=app.config["SEARCH_CACHE_TTL"],
+    maxsize=app.config["SEARCH_CACHE_MAXSIZE"],
+    wait=app.config["SEARCH_CACHE_WAIT"],
+)
+entityCache = EntityCache(
+    app.config["ENTITY_CACHE_PATH"],
+    maxsize=app.config["ENTITY_CACHE_MAXSIZE"],
+    ttl=app.config["ENTITY_CACHE_TTL"],
+)
+
+
+@app.before_first_request
+def startChangeListener():
+    # Runs once in each serving process, after a pre-forking server has
+    # forked. A live flag copied from the parent would have the cache serve
+    # pages without a listener invalidating them, so reset it; the new
+    # listener sets it again once LISTEN is active.
+    entityCache.live = False
+    if app.config["ENTITY_CACHE_ENABLED"]:
+        ChangeListener(app, db, entityCache, "fyyur_entity", searchCache).start()
+
 
 # ----------------------------------------------------------------------------#
 # Models.
@@ -35,6 +111,7 @@ migrate = Migrate(app, db)
 
 
 class ArrayOfEnum(TypeDecorator):
+    # PostgreSQL-only; still used by the early migrations. Models use GenreList
     impl = ARRAY
 
     def bind_expression(self, bindvalue):
@@ -69,12 +146,76 @@ class GenreType(Enum):
         return str(self.value)
 
 
+# Bit for each genre in GenreList's integer encoding; append new genres at the
+# end so stored masks keep their meaning
+GENRE_BITS = {genre: 1 << index for index, genre in enumerate(GenreType)}
+
+
+class GenreList(TypeDecorator):
+    """List of GenreType values.
+
+    Stored as a native genre_type[] array on PostgreSQL and as an integer
+    bitmask on other databases, so the models also work on SQLite (e.g. an
+    in-memory database for tests).
+    """
+
+    impl = sa.Integer
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(ARRAY(ENUM(GenreType, name="genre_type")))
+        return dialect.type_descriptor(sa.Integer())
+
+    def bind_expression(self, bindvalue):
+        # Lets PostgreSQL read the bound list as genre_type[] instead of text[]
+        return sa.cast(bindvalue, self)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        genres = [
+            genre if isinstance(genre, GenreType) else GenreType[genre]
+            for genre in value
+        ]
+        if dialect.name == "postgresql":
+            return genres
+        mask = 0
+        for genre in genres:
+            mask |= GENRE_BITS[genre]
+        return mask
+
+    def result_processor(self, dialect, coltype):
+        if dialect.name != "postgresql":
+
+            def decode(value):
+                if value is None:
+                    return None
+                return [genre for genre, bit in GENRE_BITS.items() if value & bit]
+
+            return decode
+
+        arrayProcessor = self.impl.result_processor(dialect, coltype)
+
+        def process(value):
+            if value is None:
+                return None
+            # psycopg2 returns arrays of an unregistered enum as "{a,b}"
+            if isinstance(value, str):
+                inner = re.match(r"^{(.*)}$", value).group(1)
+                value = inner.split(",") if inner else []
+            return arrayProcessor(value) if arrayProcessor else value
+
+        return process
+
+
 class Venue(db.Model):
     __tablename__ = "Venue"
+    __table_args__ = (db.Index("ix_Venue_city_state", "city", "state"),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(ArrayOfEnum(ENUM(GenreType, name="genre_type")))
+    genres = db.Column(GenreList)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
@@ -84,33 +225,209 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.Text)
-    shows = db.relationship("Show", backref="venue", lazy=True)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+    shows = db.relationship("Show", backref="venue", lazy=True, passive_deletes=True)
 
 
 class Artist(db.Model):
     __tablename__ = "Artist"
+    __table_args__ = (db.Index("ix_Artist_city_state", "city", "state"),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(ArrayOfEnum(ENUM(GenreType, name="genre_type")))
+    genres = db.Column(GenreList)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.Text)
-    shows = db.relationship("Show", backref="artist", lazy=True)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+    shows = db.relationship("Show", backref="artist", lazy=True, passive_deletes=True)
 
 
 class Show(db.Model):
     __tablename__ = "Show"
+    __table_args__ = (
+        db.Index("ix_Show_venue_id_start_time", "venue_id", "start_time"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Artist.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    venue_id = db.Column(
+        db.Integer, db.ForeignKey("Venue.id", ondelete="CASCADE"), nullable=False
+    )
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Job(db.Model):
+    __tablename__ = "Job"
+    __table_args__ = (db.Index("ix_Job_status_run_after", "status", "run_after"),)
 
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    last_error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+
+class Match(db.Model):
+    # Precomputed artist/venue matches, kept up to date by the
+    # refresh_matches job so page views never cross-join Artist and Venue
+    __tablename__ = "Match"
+
+    artist_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Artist.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    venue_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    genre_overlap = db.Column(db.Integer, nullable=False)
+    artist_recent_shows = db.Column(db.Integer, nullable=False, default=0)
+    venue_recent_shows = db.Column(db.Integer, nullable=False, default=0)
+
+
+jobQueue = jobs.JobQueue(app, db, Job)
+
+
+@app.before_first_request
+def startJobQueue():
+    # Not at import time: "flask db upgrade" imports the app before the Job
+    # table exists, and a pre-forking server would start the dispatcher in
+    # the parent, leaving its children without one
+    if app.config["JOB_QUEUE_AUTOSTART"]:
+        jobQueue.start()
+
+
+# ----------------------------------------------------------------------------#
+# Cache invalidation.
+# ----------------------------------------------------------------------------#
+
+
+def markSearchStale(session, namespace):
+    # Queue a search cache namespace to be dropped once the session commits
+    session.info.setdefault("staleSearches", set()).add(namespace)
+
+
+@event.listens_for(Session, "before_flush")
+def queueSearchInvalidation(session, flushContext, instances):
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Venue):
+            markSearchStale(session, "venues")
+        elif isinstance(obj, Artist):
+            markSearchStale(session, "artists")
+    for obj in session.dirty:
+        if not isinstance(obj, (Venue, Artist)):
+            continue
+        if inspect(obj).attrs.name.history.has_changes():
+            markSearchStale(session, "venues" if isinstance(obj, Venue) else "artists")
+
+
+@event.listens_for(Session, "before_commit")
+def announceSearchInvalidation(session):
+    # Other workers drop their entries when their ChangeListener receives
+    # this; NOTIFY is only delivered if the transaction commits. before_commit
+    # runs ahead of the final flush, so flush first to see every change.
+    session.flush()
+    stale = session.info.get("staleSearches")
+    if not stale or session.get_bind().dialect.name != "postgresql":
+        return
+    for namespace in sorted(stale):
+        session.execute(
+            sa.text("SELECT pg_notify('fyyur_entity', :payload)"),
+            {"payload": f"search:{namespace}"},
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def flushSearchInvalidation(session):
+    for namespace in session.info.pop("staleSearches", ()):
+        searchCache.invalidate(namespace)
+
+
+@event.listens_for(Session, "after_rollback")
+def discardSearchInvalidation(session):
+    session.info.pop("staleSearches", None)
+    session.info.pop("staleMatches", None)
+
+
+# ----------------------------------------------------------------------------#
+# Match maintenance.
+# ----------------------------------------------------------------------------#
+
+MATCH_FIELDS = ("city", "state", "genres", "seeking_venue", "seeking_talent")
+
+
+def refreshMatchesLater(session, artists=(), venues=()):
+    # The job is added to the same transaction, so it only runs if the
+    # change that made the matches stale commits
+    session.add(
+        jobQueue.build(
+            "refresh_matches", {"artists": sorted(artists), "venues": sorted(venues)}
+        )
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def collectMatchChanges(session, flushContext, instances):
+    stale = session.info.setdefault("staleMatches", [])
+    for obj in session.new:
+        if isinstance(obj, (Venue, Artist, Show)):
+            stale.append(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Show):
+            # Both sides' recent show activity changes
+            stale.append((obj.artist_id, obj.venue_id))
+    for obj in session.dirty:
+        if not isinstance(obj, (Venue, Artist)):
+            continue
+        attrs = inspect(obj).attrs
+        if any(
+            attrs[field].history.has_changes()
+            for field in MATCH_FIELDS
+            if field in attrs.keys()
+        ):
+            stale.append(obj)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def queueMatchRefresh(session, flushContext):
+    # New objects only have ids once flushed, so resolve them here
+    stale = session.info.pop("staleMatches", None)
+    if not stale:
+        return
+    artists, venues = set(), set()
+    for obj in stale:
+        if isinstance(obj, Artist):
+            artists.add(obj.id)
+        elif isinstance(obj, Venue):
+            venues.add(obj.id)
+        elif isinstance(obj, Show):
+            artists.add(obj.artist_id)
+            venues.add(obj.venue_id)
+        else:
+            artists.add(obj[0])
+            venues.add(obj[1])
+    refreshMatchesLater(session, artists, venues)
 
 
 # ----------------------------------------------------------------------------#
@@ -118,8 +435,16 @@ class Show(db.Model):
 # ----------------------------------------------------------------------------#
 
 
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
 def format_datetime(value, format="medium"):
-    date = dateutil.parser.parse(value)
+    # Controllers pass start times as ISO_FORMAT strings; parsing that exact
+    # format is much cheaper than dateutil's guesswork in large listings
+    try:
+        date = datetime.strptime(value, ISO_FORMAT)
+    except ValueError:
+        date = dateutil.parser.parse(value)
     if format == "full":
         format = "EEEE MMMM, d, y 'at' h:mma"
     elif format == "medium":
@@ -159,12 +484,387 @@ def sortUpcomingShows(shows, now, isArtist=False):
     return sortedShows
 
 
-def countIsUpcoming(shows, now):
-    result = 0
-    for show in shows:
-        if show.start_time > now:
-            result += 1
-    return result
+def nextShowChange(shows, now):
+    # When the earliest upcoming show starts it moves to past shows, so a
+    # cached page built from these shows is only valid until then
+    upcoming = [show.start_time for show in shows if show.start_time > now]
+    return min(upcoming).timestamp() if upcoming else None
+
+
+def escapeLike(value):
+    # Match % and _ literally in LIKE/ILIKE patterns (used with escape="\\")
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def parseDateArg(name):
+    # Parse an optional date/datetime query string argument, 400 on garbage.
+    # Show.start_time is naive, so times with an offset are converted to UTC
+    # and compared without one.
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = dateutil.parser.parse(value)
+    except (ValueError, OverflowError):
+        abort(400, f"Invalid '{name}' date: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parseIdList(name):
+    # Parse an optional comma-separated list of ids ("1,2,3"), 400 on garbage
+    value = request.args.get(name, "")
+    try:
+        return sorted({int(part) for part in value.split(",") if part.strip()})
+    except ValueError:
+        abort(400, f"Invalid '{name}' ids: {value}")
+
+
+def iterRows(query):
+    # Stream rows from a server-side cursor in batches instead of .all()
+    return query.yield_per(app.config["STREAM_BATCH_SIZE"])
+
+
+def icsEscape(value):
+    return (
+        str(value or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def icsLine(line):
+    # Fold content lines longer than 75 octets as required by RFC 5545
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    # The first line holds 75 octets, continuations 74 after the leading space
+    limit = 75
+    while len(encoded) > limit:
+        cut = limit
+        # Never split in the middle of a multi-byte character
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+        limit = 74
+    parts.append(encoded.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def streamCalendar(calendarName, rows):
+    # rows yield (show_id, start_time, artist_name, venue_name, location)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    yield icsLine("BEGIN:VCALENDAR")
+    yield icsLine("VERSION:2.0")
+    yield icsLine("PRODID:-//Fyyur//Shows//EN")
+    yield icsLine("X-WR-CALNAME:" + icsEscape(calendarName))
+    for showId, startTime, artistName, venueName, location in rows:
+        yield "".join(
+            icsLine(line)
+            for line in (
+                "BEGIN:VEVENT",
+                f"UID:show-{showId}@fyyur",
+                "DTSTAMP:" + stamp,
+                "DTSTART:" + startTime.strftime("%Y%m%dT%H%M%SZ"),
+                "SUMMARY:" + icsEscape(f"{artistName} at {venueName}"),
+                "LOCATION:" + icsEscape(location),
+                "END:VEVENT",
+            )
+        )
+    yield icsLine("END:VCALENDAR")
+
+
+def calendarResponse(calendarName, query):
+    rows = (
+        (row[0], row[1], row[2], row[3], ", ".join(filter(None, row[4:])))
+        for row in iterRows(query)
+    )
+    return Response(
+        stream_with_context(streamCalendar(calendarName, rows)),
+        mimetype="text/calendar",
+    )
+
+
+def calendarQuery():
+    return (
+        db.session.query(
+            Show.id,
+            Show.start_time,
+            Artist.name,
+            Venue.name,
+            Venue.address,
+            Venue.city,
+            Venue.state,
+        )
+        .join(Artist, Show.artist_id == Artist.id)
+        .join(Venue, Show.venue_id == Venue.id)
+        .order_by(Show.start_time)
+    )
+
+
+def parseGenres(values):
+    # Form choices are GenreType values ("Rock n Roll"); raises ValueError for
+    # genres the genre_type enum doesn't support
+    return [GenreType(value) for value in values]
+
+
+def updateVersioned(model, recordId, version, values):
+    # Optimistic concurrency: a single UPDATE ... WHERE id=? AND version=?.
+    # Returns False when someone else saved the record in the meantime.
+    values = dict(values, version=model.version + 1)
+    updated = model.query.filter(
+        model.id == recordId, model.version == version
+    ).update(values, synchronize_session=False)
+    if not updated:
+        db.session.rollback()
+        if db.session.query(model.id).filter(model.id == recordId).scalar() is None:
+            abort(404)
+        return False
+    # Bulk updates skip flush events, so queue the search invalidation and
+    # the match refresh here
+    if model is Venue:
+        markSearchStale(db.session, "venues")
+        refreshMatchesLater(db.session, venues=[recordId])
+    else:
+        markSearchStale(db.session, "artists")
+        refreshMatchesLater(db.session, artists=[recordId])
+    db.session.commit()
+    return True
+
+
+def deleteCascading(model, recordId):
+    # One DELETE statement; the database removes the record's shows through
+    # ON DELETE CASCADE, so none of them are loaded into the session.
+    # Returns False if there was no such record.
+    deleted = model.query.filter(model.id == recordId).delete(
+        synchronize_session=False
+    )
+    if not deleted:
+        db.session.rollback()
+        return False
+    # Both searches show upcoming show counts, which the cascade changes
+    markSearchStale(db.session, "venues")
+    markSearchStale(db.session, "artists")
+    db.session.commit()
+    return True
+
+
+EXPORT_COLUMNS = (
+    "id",
+    "start_time",
+    "artist_id",
+    "artist_name",
+    "venue_id",
+    "venue_name",
+    "venue_city",
+    "venue_state",
+)
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def exportRows(after=None):
+    # Keyset order on Show.id, so an interrupted export resumes with
+    # ?after=<last id received> instead of starting again or using OFFSET
+    query = (
+        db.session.query(
+            Show.id,
+            Show.start_time,
+            Show.artist_id,
+            Artist.name,
+            Show.venue_id,
+            Venue.name,
+            Venue.city,
+            Venue.state,
+        )
+        .join(Artist, Show.artist_id == Artist.id)
+        .join(Venue, Show.venue_id == Venue.id)
+        .order_by(Show.id)
+    )
+    if after is not None:
+        query = query.filter(Show.id > after)
+    for row in iterRows(query):
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record["start_time"] = record["start_time"].isoformat()
+        yield record
+
+
+def csvChunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([row[column] for column in EXPORT_COLUMNS])
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonlChunks(rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(lines)
+            lines = []
+            size = 0
+    yield "".join(lines)
+
+
+EXPORT_FORMATS = {
+    "csv": (csvChunks, "text/csv"),
+    "jsonl": (jsonlChunks, "application/x-ndjson"),
+}
+
+
+def countShowsAfter(column, ids, after):
+    # Show counts per venue/artist id in one grouped query. Bounding
+    # start_time lets Postgres prune the partitioned Show table to the
+    # recent and future months instead of loading every show per row.
+    if not ids:
+        return {}
+    return dict(
+        db.session.query(column, db.func.count(Show.id))
+        .filter(column.in_(ids), Show.start_time > after)
+        .group_by(column)
+        .all()
+    )
+
+
+def refreshArtistMatches(artistId):
+    # Recompute one artist's Match rows: venues seeking talent in the same
+    # city and state that share at least one genre
+    Match.query.filter(Match.artist_id == artistId).delete(synchronize_session=False)
+    artist = Artist.query.get(artistId)
+    if artist is None or not artist.seeking_venue or not artist.genres:
+        return
+    candidates = (
+        db.session.query(Venue.id, Venue.genres)
+        .filter(
+            Venue.city == artist.city,
+            Venue.state == artist.state,
+            Venue.seeking_talent.is_(True),
+        )
+        .all()
+    )
+    insertMatches(
+        [(artistId, venueId, artist.genres, genres) for venueId, genres in candidates]
+    )
+
+
+def refreshVenueMatches(venueId):
+    Match.query.filter(Match.venue_id == venueId).delete(synchronize_session=False)
+    venue = Venue.query.get(venueId)
+    if venue is None or not venue.seeking_talent or not venue.genres:
+        return
+    candidates = (
+        db.session.query(Artist.id, Artist.genres)
+        .filter(
+            Artist.city == venue.city,
+            Artist.state == venue.state,
+            Artist.seeking_venue.is_(True),
+        )
+        .all()
+    )
+    insertMatches(
+        [(artistId, venueId, genres, venue.genres) for artistId, genres in candidates]
+    )
+
+
+def insertMatches(pairs):
+    # pairs are (artist_id, venue_id, artist genres, venue genres)
+    pairs = [
+        (artistId, venueId, len(set(artistGenres or ()) & set(venueGenres or ())))
+        for artistId, venueId, artistGenres, venueGenres in pairs
+    ]
+    pairs = [pair for pair in pairs if pair[2]]
+    if not pairs:
+        return
+    since = datetime.now() - timedelta(days=app.config["MATCH_RECENT_DAYS"])
+    artistActivity = countShowsAfter(Show.artist_id, {pair[0] for pair in pairs}, since)
+    venueActivity = countShowsAfter(Show.venue_id, {pair[1] for pair in pairs}, since)
+    rows = [
+        {
+            "artist_id": artistId,
+            "venue_id": venueId,
+            "genre_overlap": overlap,
+            "artist_recent_shows": artistActivity.get(artistId, 0),
+            "venue_recent_shows": venueActivity.get(venueId, 0),
+        }
+        for artistId, venueId, overlap in pairs
+    ]
+    # An artist refresh and a venue refresh running at the same time can both
+    # insert the same pair after deleting their own rows; the second insert
+    # is skipped instead of failing the job on the primary key
+    if db.engine.dialect.name == "postgresql":
+        statement = pgInsert(Match.__table__).on_conflict_do_nothing()
+    else:
+        statement = Match.__table__.insert().prefix_with("OR IGNORE")
+    db.session.execute(statement, rows)
+
+
+def hasGenre(column, genre):
+    # genres @> ARRAY[genre] on PostgreSQL, a bit test on GenreList's bitmask
+    # elsewhere
+    if db.engine.dialect.name == "postgresql":
+        return column.op("@>")([genre])
+    return sa.type_coerce(column, sa.Integer).op("&")(GENRE_BITS[genre]) != 0
+
+
+def matchingVenues(artistId):
+    return (
+        db.session.query(Venue.id, Venue.name, Venue.image_link, Match.genre_overlap)
+        .join(Match, Match.venue_id == Venue.id)
+        .filter(Match.artist_id == artistId)
+        .order_by(Match.genre_overlap.desc(), Match.venue_recent_shows.desc())
+        .limit(app.config["MATCH_LIMIT"])
+        .all()
+    )
+
+
+def matchingArtists(venueId):
+    return (
+        db.session.query(Artist.id, Artist.name, Artist.image_link, Match.genre_overlap)
+        .join(Match, Match.artist_id == Artist.id)
+        .filter(Match.venue_id == venueId)
+        .order_by(Match.genre_overlap.desc(), Match.artist_recent_shows.desc())
+        .limit(app.config["MATCH_LIMIT"])
+        .all()
+    )
+
+
+# ----------------------------------------------------------------------------#
+# Jobs.
+# ----------------------------------------------------------------------------#
+
+
+@jobs.job("refresh_matches")
+def refresh_matches(artists=(), venues=()):
+    for artistId in artists:
+        refreshArtistMatches(artistId)
+    for venueId in venues:
+        refreshVenueMatches(venueId)
+    db.session.commit()
+
+
+@app.cli.command("rebuild-matches")
+def rebuild_matches():
+    """Recompute the whole Match table, e.g. nightly to age show activity."""
+    Match.query.delete(synchronize_session=False)
+    for (artistId,) in db.session.query(Artist.id).filter(
+        Artist.seeking_venue.is_(True)
+    ):
+        refreshArtistMatches(artistId)
+    db.session.commit()
 
 
 # ----------------------------------------------------------------------------#
@@ -186,6 +886,9 @@ def venues():
     # Query data from Venue table in db
     dbData = Venue.query.all()
     now = datetime.now()
+    upcomingCounts = countShowsAfter(
+        Show.venue_id, [venue.id for venue in dbData], now
+    )
 
     # Transform data into dictionary
     venuesDict = {}
@@ -195,7 +898,7 @@ def venues():
                 {
                     "id": venue.id,
                     "name": venue.name,
-                    "num_upcoming_shows": countIsUpcoming(venue.shows, now),
+                    "num_upcoming_shows": upcomingCounts.get(venue.id, 0),
                 }
             ]
         else:
@@ -203,7 +906,7 @@ def venues():
                 {
                     "id": venue.id,
                     "name": venue.name,
-                    "num_upcoming_shows": countIsUpcoming(venue.shows, now),
+                    "num_upcoming_shows": upcomingCounts.get(venue.id, 0),
                 }
             )
 
@@ -214,36 +917,107 @@ def venues():
     return render_template("pages/venues.html", areas=data)
 
 
+@app.route("/venues/available")
+def available_venues():
+    # Venues with no show between ?from= and ?to=, optionally narrowed to a
+    # city/state (ix_Venue_city_state) and a genre. The NOT EXISTS is answered
+    # from the Show(venue_id, start_time) index, one range probe per venue.
+    rangeFrom = parseDateArg("from")
+    rangeTo = parseDateArg("to")
+    city = request.args.get("city", "").strip()
+    state = request.args.get("state", "").strip()
+    genre = request.args.get("genre", "").strip()
+    page = request.args.get("page", 1, type=int)
+
+    results = None
+    venues = []
+    if rangeFrom is not None and rangeTo is not None:
+        if rangeTo <= rangeFrom:
+            abort(400, "'to' must be after 'from'")
+        busy = sa.exists().where(
+            sa.and_(
+                Show.venue_id == Venue.id,
+                Show.start_time >= rangeFrom,
+                Show.start_time < rangeTo,
+            )
+        )
+        query = db.session.query(Venue.id, Venue.name).filter(~busy)
+        if city:
+            query = query.filter(Venue.city == city)
+        if state:
+            query = query.filter(Venue.state == state)
+        if genre:
+            try:
+                query = query.filter(hasGenre(Venue.genres, GenreType(genre)))
+            except ValueError:
+                abort(400, f"Unknown genre: {genre}")
+        results = query.order_by(Venue.name, Venue.id).paginate(
+            page=page,
+            per_page=app.config["AVAILABLE_VENUES_PER_PAGE"],
+            error_out=False,
+        )
+        venues = [{"id": row.id, "name": row.name} for row in results.items]
+
+    def pageUrl(number):
+        return url_for("available_venues", **dict(request.args.to_dict(), page=number))
+
+    return render_template(
+        "pages/available_venues.html",
+        results=results,
+        venues=venues,
+        pageUrl=pageUrl,
+        genres=[str(genre) for genre in GenreType],
+        args=request.args,
+    )
+
+
 @app.route("/venues/search", methods=["POST"])
 def search_venues():
     searchTerm = request.form.get("search_term", "")
+    # Queried with the normalized term the result is cached under
+    response = searchCache.get("venues", searchTerm, searchVenues)
+    return render_template(
+        "pages/search_venues.html", results=response, search_term=searchTerm,
+    )
+
+
+def searchVenues(searchTerm):
     dbData = Venue.query.filter(Venue.name.ilike(f"%{searchTerm}%")).all()
     now = datetime.now()
-    response = {
+    upcomingCounts = countShowsAfter(
+        Show.venue_id, [result.id for result in dbData], now
+    )
+    return {
         "count": len(dbData),
         "data": [
             {
                 "id": result.id,
                 "name": result.name,
-                "num_upcoming_shows": countIsUpcoming(result.shows, now),
+                "num_upcoming_shows": upcomingCounts.get(result.id, 0),
             }
             for result in dbData
         ],
     }
-    return render_template(
-        "pages/search_venues.html", results=response, search_term=searchTerm,
-    )
 
 
 @app.route("/venues/<int:venue_id>")
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
+    parsedData = entityCache.get(f"venue:{venue_id}", lambda: buildVenue(venue_id))
+    return render_template(
+        "pages/show_venue.html", venue=parsedData, matches=matchingArtists(venue_id)
+    )
+
+
+def buildVenue(venue_id):
     dbData = (
         Venue.query.join(Show, isouter=True)
         .join(Artist, isouter=True)
         .filter(Venue.id == venue_id)
         .first()
     )
+    if dbData is None:
+        abort(404)
     now = datetime.now()
     # Sort shows based on start_time into whether upcoming or past
     sortedShows = sortUpcomingShows(dbData.shows, now)
@@ -252,7 +1026,7 @@ def show_venue(venue_id):
     parsedData = {
         "id": dbData.id,
         "name": dbData.name,
-        "genres": dbData.genres,
+        "genres": [str(genre) for genre in dbData.genres or []],
         "address": dbData.address,
         "city": dbData.city,
         "state": dbData.state,
@@ -267,8 +1041,14 @@ def show_venue(venue_id):
         "past_shows_count": len(sortedShows["past"]),
         "upcoming_shows_count": len(sortedShows["upcoming"]),
     }
+    return parsedData, nextShowChange(dbData.shows, now)
 
-    return render_template("pages/show_venue.html", venue=parsedData)
+
+@app.route("/venues/<int:venue_id>/shows.ics")
+def venue_calendar(venue_id):
+    venue = Venue.query.get_or_404(venue_id)
+    query = calendarQuery().filter(Show.venue_id == venue_id)
+    return calendarResponse(venue.name, query)
 
 
 #  Create Venue
@@ -294,14 +1074,20 @@ def create_venue_submission():
     return render_template("pages/home.html")
 
 
-@app.route("/venues/<venue_id>", methods=["DELETE"])
+@app.route("/venues/<int:venue_id>", methods=["DELETE"])
 def delete_venue(venue_id):
-    # TODO: Complete this endpoint for taking a venue_id, and using
-    # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
-    # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-    # clicking that button delete it from the db then redirect the user to the homepage
-    return None
+    try:
+        deleted = deleteCascading(Venue, venue_id)
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception("Deleting venue %s failed", venue_id)
+        flash("An error occurred. Venue could not be deleted.")
+        return redirect(url_for("show_venue", venue_id=venue_id), code=303)
+    if not deleted:
+        abort(404)
+    flash("Venue was successfully deleted!")
+    # 303 so that clients following the redirect switch to GET
+    return redirect(url_for("index"), code=303)
 
 
 #  Artists
@@ -317,40 +1103,58 @@ def search_artists():
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     searchTerm = request.form.get("search_term", "")
+    response = searchCache.get("artists", searchTerm, searchArtists)
+    return render_template(
+        "pages/search_artists.html", results=response, search_term=searchTerm,
+    )
+
+
+def searchArtists(searchTerm):
     dbData = Artist.query.filter(Artist.name.ilike(f"%{searchTerm}%")).all()
     now = datetime.now()
-    response = {
+    upcomingCounts = countShowsAfter(
+        Show.artist_id, [result.id for result in dbData], now
+    )
+    return {
         "count": len(dbData),
         "data": [
             {
                 "id": result.id,
                 "name": result.name,
-                "num_upcoming_shows": countIsUpcoming(result.shows, now),
+                "num_upcoming_shows": upcomingCounts.get(result.id, 0),
             }
             for result in dbData
         ],
     }
-    return render_template(
-        "pages/search_artists.html", results=response, search_term=searchTerm,
-    )
 
 
 @app.route("/artists/<int:artist_id>")
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
+    parsedData = entityCache.get(
+        f"artist:{artist_id}", lambda: buildArtist(artist_id)
+    )
+    return render_template(
+        "pages/show_artist.html", artist=parsedData, matches=matchingVenues(artist_id)
+    )
+
+
+def buildArtist(artist_id):
     dbData = (
         Artist.query.join(Show, isouter=True)
         .join(Venue, isouter=True)
         .filter(Artist.id == artist_id)
         .first()
     )
+    if dbData is None:
+        abort(404)
     now = datetime.now()
     # Sort shows based on start_time into whether upcoming or past
     sortedShows = sortUpcomingShows(dbData.shows, now, True)
     parsedData = {
         "id": dbData.id,
         "name": dbData.name,
-        "genres": dbData.genres,
+        "genres": [str(genre) for genre in dbData.genres or []],
         "city": dbData.city,
         "state": dbData.state,
         "phone": dbData.phone,
@@ -364,65 +1168,122 @@ def show_artist(artist_id):
         "past_shows_count": len(sortedShows["past"]),
         "upcoming_shows_count": len(sortedShows["upcoming"]),
     }
+    return parsedData, nextShowChange(dbData.shows, now)
+
+
+@app.route("/artists/<int:artist_id>/shows.ics")
+def artist_calendar(artist_id):
+    artist = Artist.query.get_or_404(artist_id)
+    query = calendarQuery().filter(Show.artist_id == artist_id)
+    return calendarResponse(artist.name, query)
 
-    return render_template("pages/show_artist.html", artist=parsedData)
+
+@app.route("/artists/<int:artist_id>", methods=["DELETE"])
+def delete_artist(artist_id):
+    try:
+        deleted = deleteCascading(Artist, artist_id)
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception("Deleting artist %s failed", artist_id)
+        flash("An error occurred. Artist could not be deleted.")
+        return redirect(url_for("show_artist", artist_id=artist_id), code=303)
+    if not deleted:
+        abort(404)
+    flash("Artist was successfully deleted!")
+    return redirect(url_for("index"), code=303)
 
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route("/artists/<int:artist_id>/edit", methods=["GET"])
 def edit_artist(artist_id):
-    form = ArtistForm()
-    artist = {
-        "id": 4,
-        "name": "Guns N Petals",
-        "genres": ["Rock n Roll"],
-        "city": "San Francisco",
-        "state": "CA",
-        "phone": "326-123-5000",
-        "website": "https://www.gunsnpetalsband.com",
-        "facebook_link": "https://www.facebook.com/GunsNPetals",
-        "seeking_venue": True,
-        "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-        "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    }
-    # TODO: populate form with fields from artist with ID <artist_id>
+    artist = Artist.query.get_or_404(artist_id)
+    form = ArtistForm(obj=artist)
+    form.genres.data = [str(genre) for genre in artist.genres or []]
     return render_template("forms/edit_artist.html", form=form, artist=artist)
 
 
 @app.route("/artists/<int:artist_id>/edit", methods=["POST"])
 def edit_artist_submission(artist_id):
-    # TODO: take values from the form submitted, and update existing
-    # artist record with ID <artist_id> using the new attributes
-
+    # No lock is held while the user edits: the form carries the version it
+    # was rendered from and the update only applies if that is still current
+    try:
+        version = int(request.form["version"])
+        values = {
+            "name": request.form["name"],
+            "city": request.form["city"],
+            "state": request.form["state"],
+            "phone": request.form.get("phone"),
+            "genres": parseGenres(request.form.getlist("genres")),
+            "facebook_link": request.form.get("facebook_link"),
+        }
+    except (KeyError, ValueError):
+        flash("An error occurred. Artist could not be updated.")
+        return redirect(url_for("edit_artist", artist_id=artist_id))
+
+    try:
+        updated = updateVersioned(Artist, artist_id, version, values)
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception("Updating artist %s failed", artist_id)
+        flash("An error occurred. Artist " + values["name"] + " could not be updated.")
+        return redirect(url_for("edit_artist", artist_id=artist_id))
+    if not updated:
+        flash(
+            "Artist "
+            + values["name"]
+            + " was changed by someone else while you were editing. "
+            "Review the latest details and submit your changes again."
+        )
+        return redirect(url_for("edit_artist", artist_id=artist_id))
+
+    flash("Artist " + values["name"] + " was successfully updated!")
     return redirect(url_for("show_artist", artist_id=artist_id))
 
 
 @app.route("/venues/<int:venue_id>/edit", methods=["GET"])
 def edit_venue(venue_id):
-    form = VenueForm()
-    venue = {
-        "id": 1,
-        "name": "The Musical Hop",
-        "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-        "address": "1015 Folsom Street",
-        "city": "San Francisco",
-        "state": "CA",
-        "phone": "123-123-1234",
-        "website": "https://www.themusicalhop.com",
-        "facebook_link": "https://www.facebook.com/TheMusicalHop",
-        "seeking_talent": True,
-        "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-        "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    }
-    # TODO: populate form with values from venue with ID <venue_id>
+    venue = Venue.query.get_or_404(venue_id)
+    form = VenueForm(obj=venue)
+    form.genres.data = [str(genre) for genre in venue.genres or []]
     return render_template("forms/edit_venue.html", form=form, venue=venue)
 
 
 @app.route("/venues/<int:venue_id>/edit", methods=["POST"])
 def edit_venue_submission(venue_id):
-    # TODO: take values from the form submitted, and update existing
-    # venue record with ID <venue_id> using the new attributes
+    # Same optimistic concurrency scheme as edit_artist_submission
+    try:
+        version = int(request.form["version"])
+        values = {
+            "name": request.form["name"],
+            "city": request.form["city"],
+            "state": request.form["state"],
+            "address": request.form["address"],
+            "phone": request.form.get("phone"),
+            "genres": parseGenres(request.form.getlist("genres")),
+            "facebook_link": request.form.get("facebook_link"),
+        }
+    except (KeyError, ValueError):
+        flash("An error occurred. Venue could not be updated.")
+        return redirect(url_for("edit_venue", venue_id=venue_id))
+
+    try:
+        updated = updateVersioned(Venue, venue_id, version, values)
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception("Updating venue %s failed", venue_id)
+        flash("An error occurred. Venue " + values["name"] + " could not be updated.")
+        return redirect(url_for("edit_venue", venue_id=venue_id))
+    if not updated:
+        flash(
+            "Venue "
+            + values["name"]
+            + " was changed by someone else while you were editing. "
+            "Review the latest details and submit your changes again."
+        )
+        return redirect(url_for("edit_venue", venue_id=venue_id))
+
+    flash("Venue " + values["name"] + " was successfully updated!")
     return redirect(url_for("show_venue", venue_id=venue_id))
 
 
@@ -455,8 +1316,22 @@ def create_artist_submission():
 
 @app.route("/shows")
 def shows():
-    # displays list of shows at /shows
-    dbData = Show.query.join("artist").join("venue").all()
+    # displays list of shows at /shows, optionally narrowed to a date range
+    # (?from=&to=, served by the Show.start_time index) and a venue city
+    rangeFrom = parseDateArg("from")
+    rangeTo = parseDateArg("to")
+    city = request.args.get("city", "").strip()
+
+    query = Show.query.join("artist").join("venue")
+    if rangeFrom is not None:
+        query = query.filter(Show.start_time >= rangeFrom)
+    if rangeTo is not None:
+        query = query.filter(Show.start_time < rangeTo)
+    if city:
+        query = query.filter(Venue.city.ilike(escapeLike(city), escape="\\"))
+    if rangeFrom is not None or rangeTo is not None:
+        query = query.order_by(Show.start_time)
+    dbData = query.all()
     data = [
         {
             "venue_id": show.venue.id,
@@ -491,6 +1366,100 @@ def create_show_submission():
     return render_template("pages/home.html")
 
 
+#  Export
+#  ----------------------------------------------------------------
+
+
+@app.route("/export/shows.<format>")
+def export_shows(format):
+    # Streams every show joined with artist and venue names from a
+    # server-side cursor; memory use doesn't grow with the catalog
+    if format not in EXPORT_FORMATS:
+        abort(404)
+    after = request.args.get("after", type=int)
+    chunks, mimetype = EXPORT_FORMATS[format]
+    return Response(
+        stream_with_context(chunks(exportRows(after))),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=shows.{format}"},
+    )
+
+
+@app.cli.command("export-shows")
+@click.option("--format", "format", type=click.Choice(EXPORT_FORMATS), default="csv")
+@click.option("--after", type=int, help="Resume after this show id.")
+@click.option("--output", type=click.File("w"), default="-")
+def export_shows_command(format, after, output):
+    """Export all shows as CSV or JSON lines."""
+    chunks, _ = EXPORT_FORMATS[format]
+    for chunk in chunks(exportRows(after)):
+        output.write(chunk)
+
+
+#  Jobs
+#  ----------------------------------------------------------------
+
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    record = Job.query.get_or_404(job_id)
+    return jsonify(
+        {
+            "id": record.id,
+            "name": record.name,
+            "status": record.status,
+            "attempts": record.attempts,
+            "max_attempts": record.max_attempts,
+            "last_error": record.last_error,
+            "run_after": record.run_after.isoformat(),
+            "created_at": record.created_at.isoformat(),
+            "updated_at": record.updated_at.isoformat(),
+        }
+    )
+
+
+# Card projections for /api/v1/batch: only these columns are selected and no
+# relationship is loaded
+BATCH_CARDS = {
+    "artists": (Artist, ("id", "name", "city", "state", "genres", "image_link")),
+    "venues": (Venue, ("id", "name", "city", "state", "genres", "image_link")),
+    "shows": (Show, ("id", "artist_id", "venue_id", "start_time")),
+}
+
+
+def batchCard(row):
+    card = row._asdict()
+    if "genres" in card:
+        card["genres"] = [str(genre) for genre in card["genres"] or []]
+    if "start_time" in card:
+        card["start_time"] = card["start_time"].strftime(ISO_FORMAT)
+    return card
+
+
+@app.route("/api/v1/batch")
+def batch_get():
+    # Multi-get for page assembly, e.g. ?artists=1,2&venues=4&shows=7: one
+    # IN query per entity type. Results are keyed by id; ids that don't exist
+    # are left out.
+    requested = {kind: parseIdList(kind) for kind in BATCH_CARDS}
+    total = sum(len(ids) for ids in requested.values())
+    if total > app.config["BATCH_MAX_IDS"]:
+        abort(400, f"At most {app.config['BATCH_MAX_IDS']} ids per request")
+
+    data = {kind: {} for kind in BATCH_CARDS}
+    for kind, ids in requested.items():
+        if not ids:
+            continue
+        model, columns = BATCH_CARDS[kind]
+        rows = (
+            db.session.query(*(getattr(model, column) for column in columns))
+            .filter(model.id.in_(ids))
+            .all()
+        )
+        data[kind] = {str(row.id): batchCard(row) for row in rows}
+    return jsonify(data)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template("errors/404.html"), 404
@@ -517,6 +1486,7 @@ if not app.debug:
 
 # Default port:
 if __name__ == "__main__":
+    jobQueue.start()
     app.run()
 
 # Or specify port manually:
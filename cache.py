@@ -0,0 +1,327 @@
+"""Search and entity caches."""
+
+import json
+import select
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+def normalizeTerm(term):
+    # "  The  Wild sax " and "the wild SAX" share a cache entry
+    return " ".join(term.split()).casefold()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SearchCache:
+    """TTL cache for search results with single-flight coalescing.
+
+    Concurrent lookups of the same key wait up to ``wait`` seconds for the
+    one request already computing it instead of running the same query
+    again; if it takes longer they compute the result themselves. Entries are grouped
+    by namespace ("venues", "artists") so a write can drop all of them at once.
+
+    compute is called with the normalized term, the same one the entry is
+    cached under. Invalidations reach other worker processes through
+    ChangeListener ("search:<namespace>" payloads); without a listener they
+    only apply to this process, and other workers may serve stale results
+    for up to ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl, maxsize, wait):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.wait = wait
+        self.entries = OrderedDict()
+        self.flights = {}
+        self.generations = {}
+        self.epoch = 0
+        self.lock = threading.Lock()
+
+    def get(self, namespace, term, compute):
+        key = (namespace, normalizeTerm(term))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                metrics.recordCache("search_" + namespace, True)
+                return entry[1]
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+                generation = (self.epoch, self.generations.get(namespace, 0))
+        metrics.recordCache("search_" + namespace, False)
+        if not leader:
+            if not flight.done.wait(self.wait):
+                # The leader is stuck, e.g. on a dead connection: don't hold
+                # this request thread hostage too
+                return compute(key[1])
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute(key[1])
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                # Don't store a result computed before an invalidation
+                if flight.error is None and generation == (
+                    self.epoch,
+                    self.generations.get(namespace, 0),
+                ):
+                    self.entries[key] = (time.monotonic() + self.ttl, flight.result)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.maxsize:
+                        self.entries.popitem(last=False)
+            flight.done.set()
+        return flight.result
+
+    def invalidate(self, namespace):
+        with self.lock:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            for key in [key for key in self.entries if key[0] == namespace]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.generations.clear()
+            self.entries.clear()
+
+
+# Row in the shared store whose version clear() bumps
+EPOCH_KEY = "*"
+STORE_SCHEMA = 1
+
+
+class EntityCache:
+    """Two-tier cache for per-entity page data such as "venue:3".
+
+    A per-process LRU sits in front of a SQLite file shared by every worker
+    on the host. Entries are evicted from both tiers when a ChangeListener
+    receives a NOTIFY for the key, and the cache is bypassed entirely while
+    no listener is connected, so a page is never served from a copy that
+    missed a notification.
+
+    Every key in the shared file carries a version that invalidate() bumps
+    rather than deleting the row. A worker reads the version before building
+    a value and only stores the value if it is unchanged, so a worker whose
+    own listener is behind can't put back a value another worker has already
+    invalidated.
+    """
+
+    def __init__(self, path, maxsize, ttl):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.epoch = 0
+        self.live = False
+        self.lock = threading.Lock()
+        self.connections = threading.local()
+        self.writes = 0
+
+    def store(self):
+        conn = getattr(self.connections, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < STORE_SCHEMA:
+                # Only cached data: files from older versions start over
+                conn.execute("DROP TABLE IF EXISTS entities")
+                conn.execute(
+                    "CREATE TABLE entities (key TEXT PRIMARY KEY, "
+                    "version INTEGER NOT NULL, expires REAL, value TEXT)"
+                )
+                conn.execute(f"PRAGMA user_version = {STORE_SCHEMA}")
+            conn.execute("COMMIT")
+            self.connections.conn = conn
+        return conn
+
+    def get(self, key, build):
+        """Return the cached value for key, calling build() on a miss.
+
+        build returns ``(value, validUntil)``; validUntil is an optional unix
+        time after which the value is wrong even without a write (e.g. when
+        the next upcoming show starts).
+        """
+        if not self.live:
+            return build()[0]
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                metrics.recordCache("entity_local", True)
+                return entry[1]
+            stamp = (self.epoch, self.generations.get(key, 0))
+        metrics.recordCache("entity_local", False)
+
+        versions = {}
+        for rowKey, version, expires, value in self.store().execute(
+            "SELECT key, version, expires, value FROM entities WHERE key IN (?, ?)",
+            (key, EPOCH_KEY),
+        ):
+            versions[rowKey] = version
+            if rowKey == key and value is not None and expires > now:
+                metrics.recordCache("entity_shared", True)
+                value = json.loads(value)
+                self.remember(key, stamp, expires, value)
+                return value
+        metrics.recordCache("entity_shared", False)
+
+        value, validUntil = build()
+        expires = now + self.ttl
+        if validUntil is not None:
+            expires = min(expires, validUntil)
+        if self.share(key, versions, expires, value):
+            self.remember(key, stamp, expires, value)
+            self.pruneStore(now)
+        return value
+
+    def share(self, key, versions, expires, value):
+        # Compare-and-set: store value only if neither the key nor the whole
+        # store was invalidated since versions were read
+        params = (expires, json.dumps(value), key)
+        epoch = (EPOCH_KEY, versions.get(EPOCH_KEY))
+        if key in versions:
+            cursor = self.store().execute(
+                "UPDATE entities SET expires = ?, value = ? "
+                "WHERE key = ? AND version = ? "
+                "AND (SELECT version FROM entities WHERE key = ?) IS ?",
+                params + (versions[key],) + epoch,
+            )
+        else:
+            cursor = self.store().execute(
+                "INSERT OR IGNORE INTO entities (expires, value, key, version) "
+                "SELECT ?, ?, ?, 0 "
+                "WHERE (SELECT version FROM entities WHERE key = ?) IS ?",
+                params + epoch,
+            )
+        return cursor.rowcount == 1
+
+    def remember(self, key, stamp, expires, value):
+        # Skip values read before an invalidation of the same key landed
+        with self.lock:
+            if stamp != (self.epoch, self.generations.get(key, 0)):
+                return False
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            return True
+
+    def pruneStore(self, now):
+        self.writes += 1
+        if self.writes % 100 == 0:
+            self.store().execute("DELETE FROM entities WHERE expires < ?", (now,))
+
+    def bump(self, key, expires):
+        # Two statements rather than an upsert, which needs SQLite 3.24
+        store = self.store()
+        store.execute(
+            "INSERT OR IGNORE INTO entities (key, version, expires) VALUES (?, 0, ?)",
+            (key, expires),
+        )
+        store.execute(
+            "UPDATE entities SET version = version + 1, expires = ?, value = NULL "
+            "WHERE key = ?",
+            (expires, key),
+        )
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+            self.entries.pop(key, None)
+        # The emptied row is kept for a TTL so builds that started before
+        # this still find a changed version
+        self.bump(key, time.time() + self.ttl)
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.generations.clear()
+            self.entries.clear()
+        # Bump first: a build that compared against the old epoch and got in
+        # before the DELETE is removed by it
+        self.bump(EPOCH_KEY, None)
+        self.store().execute("DELETE FROM entities WHERE key != ?", (EPOCH_KEY,))
+
+
+class ChangeListener(threading.Thread):
+    """LISTENs on a Postgres channel and invalidates the named cache keys.
+
+    Payloads are cache keys ("venue:3") sent by the notify triggers on
+    Venue, Artist and Show, or "search:<namespace>" sent when a commit
+    changes search results. The cache is only marked live while LISTEN is
+    active; after a reconnect both caches are cleared, since notifications
+    may have been missed in between.
+    """
+
+    def __init__(self, app, db, cache, channel, searchCache=None):
+        super().__init__(name="fyyur-cache-listener", daemon=True)
+        self.app = app
+        self.db = db
+        self.cache = cache
+        self.searchCache = searchCache
+        self.channel = channel
+        self.stopped = threading.Event()
+
+    def run(self):
+        with self.app.app_context():
+            if self.db.engine.dialect.name != "postgresql":
+                self.app.logger.info("Entity cache disabled: requires PostgreSQL")
+                return
+            while not self.stopped.is_set():
+                try:
+                    self.listen()
+                except Exception:
+                    self.app.logger.exception("Entity cache listener failed")
+                self.cache.live = False
+                self.stopped.wait(5)
+
+    def listen(self):
+        proxy = self.db.engine.raw_connection()
+        try:
+            conn = proxy.connection
+            conn.autocommit = True
+            conn.cursor().execute(f'LISTEN "{self.channel}"')
+            self.cache.clear()
+            if self.searchCache is not None:
+                self.searchCache.clear()
+            self.cache.live = True
+            while not self.stopped.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.invalidate(conn.notifies.pop(0).payload)
+        finally:
+            # The connection was switched to autocommit, don't pool it again
+            proxy.invalidate()
+
+    def invalidate(self, payload):
+        if payload.startswith("search:"):
+            if self.searchCache is not None:
+                self.searchCache.invalidate(payload[len("search:") :])
+        else:
+            self.cache.invalidate(payload)
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,204 @@
+"""Response compression middleware.
+
+Negotiates brotli (when the ``brotli`` package is installed) or gzip from the
+request's Accept-Encoding header, for the content types configured in
+COMPRESSION_TYPES. Responses smaller than COMPRESSION_MIN_SIZE are sent as
+they are. Streamed responses (no Content-Length, e.g. the exports and .ics
+feeds) are compressed chunk by chunk and flushed after every chunk, so
+streaming still delivers rows as they are produced.
+"""
+
+import zlib
+from collections import deque
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+
+def parseAcceptEncoding(header):
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def chooseEncoding(header):
+    codings = parseAcceptEncoding(header)
+    wildcard = codings.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=lambda coding: codings.get(coding, wildcard))
+    return best if codings.get(best, wildcard) > 0 else None
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 writes a gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+COMPRESSORS = {"gzip": GzipCompressor, "br": BrotliCompressor}
+
+
+class CompressionMiddleware:
+    def __init__(self, wsgiApp, types, minSize):
+        self.wsgiApp = wsgiApp
+        # {"text/html": {"gzip": 6, "br": 4}, ...}
+        self.types = types
+        self.minSize = minSize
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") == "HEAD":
+            return self.wsgiApp(environ, start_response)
+        encoding = chooseEncoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        captured = {}
+        # Data passed to the legacy write() callable, sent ahead of the body
+        written = deque()
+
+        def captureStart(status, headers, exc_info=None):
+            captured["response"] = (status, headers, exc_info)
+            return written.append
+
+        appIter = self.wsgiApp(environ, captureStart)
+        return self.respond(appIter, captured, encoding, start_response, written)
+
+    @staticmethod
+    def body(appIter, written):
+        # The body in order: anything written before a chunk was produced
+        # goes out ahead of it
+        for chunk in appIter:
+            while written:
+                yield written.popleft()
+            yield chunk
+        while written:
+            yield written.popleft()
+
+    def settings(self, status, headers, encoding):
+        # Returns (vary, level): whether the response depends on
+        # Accept-Encoding, and the compression level to use or None to pass
+        # through. Any compressible type varies, even when this response is
+        # sent as it is, so shared caches don't hand it to other clients.
+        values = {name.lower(): value for name, value in headers}
+        code = int(status.split(" ", 1)[0])
+        mimetype = values.get("content-type", "").split(";")[0].strip().lower()
+        levels = self.types.get(mimetype)
+        if levels is None:
+            return False, None
+        if (
+            encoding is None
+            or code < 200
+            or code in (204, 304)
+            or "content-encoding" in values
+            or "content-range" in values
+            or "no-transform" in values.get("cache-control", "")
+        ):
+            return True, None
+        # None (pass through) when the type has no level for this encoding
+        return True, levels.get(encoding)
+
+    def respond(self, appIter, captured, encoding, start_response, written):
+        try:
+            iterator = self.body(appIter, written)
+            pending = []
+            if "response" not in captured:
+                # start_response may be deferred until the first chunk
+                pending.append(next(iterator, b""))
+            status, headers, excInfo = captured["response"]
+            vary, level = self.settings(status, headers, encoding)
+            if vary:
+                headers = self.addVary(headers)
+            if level is None:
+                start_response(status, headers, excInfo)
+                yield from pending
+                yield from iterator
+                return
+
+            length = next(
+                (value for name, value in headers if name.lower() == "content-length"),
+                None,
+            )
+            # Hold back up to minSize bytes: small bodies go out uncompressed
+            size = sum(len(chunk) for chunk in pending)
+            exhausted = False
+            while size < self.minSize:
+                chunk = next(iterator, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                pending.append(chunk)
+                size += len(chunk)
+            if exhausted or (length is not None and int(length) < self.minSize):
+                start_response(status, headers, excInfo)
+                yield from pending
+                yield from iterator
+                return
+
+            compressor = COMPRESSORS[encoding](level)
+            headers = [
+                (name, value)
+                for name, value in headers
+                if name.lower() != "content-length"
+            ]
+            headers.append(("Content-Encoding", encoding))
+            if length is not None:
+                # The whole body is already in memory: compress it in one go
+                body = b"".join(pending) + b"".join(iterator)
+                body = compressor.compress(body) + compressor.finish()
+                headers.append(("Content-Length", str(len(body))))
+                start_response(status, headers, excInfo)
+                yield body
+                return
+
+            start_response(status, headers, excInfo)
+            yield compressor.compress(b"".join(pending)) + compressor.flush()
+            for chunk in iterator:
+                if chunk:
+                    yield compressor.compress(chunk) + compressor.flush()
+            yield compressor.finish()
+        finally:
+            if hasattr(appIter, "close"):
+                appIter.close()
+
+    @staticmethod
+    def addVary(headers):
+        for index, (name, value) in enumerate(headers):
+            if name.lower() == "vary":
+                if "accept-encoding" not in value.lower():
+                    headers = list(headers)
+                    headers[index] = (name, value + ", Accept-Encoding")
+                return headers
+        return list(headers) + [("Vary", "Accept-Encoding")]
@@ -1,14 +1,140 @@
 import os
 
-SECRET_KEY = os.urandom(32)
+# Set SECRET_KEY when running several workers so they share sessions and CSRF
+SECRET_KEY = os.environ.get("SECRET_KEY") or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Enable debug mode.
 DEBUG = True
 
-# Connect to the database
+# Connect to the database. DATABASE_URL selects another one, e.g. "sqlite://"
+# for an in-memory database that the tests and benchmarks can run against
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    "DATABASE_URL", "postgresql://jasonzheng@localhost:5432/fyyur"
+)
+# Hosting providers still hand out "postgres://" URLs, which SQLAlchemy 1.4
+# no longer accepts
+if SQLALCHEMY_DATABASE_URI.startswith("postgres://"):
+    SQLALCHEMY_DATABASE_URI = "postgresql://" + SQLALCHEMY_DATABASE_URI[11:]
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+SQLALCHEMY_ENGINE_OPTIONS = {}
+if SQLALCHEMY_DATABASE_URI in ("sqlite://", "sqlite:///:memory:"):
+    # Every connection to an in-memory database gets its own, empty database:
+    # share a single connection across threads instead
+    from sqlalchemy.pool import StaticPool
 
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": StaticPool,
+        "connect_args": {"check_same_thread": False},
+    }
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = "postgres://jasonzheng@localhost:5432/fyyur"
+# Rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+# Index method for Show.start_time: "btree", or "brin" for very large,
+# append-mostly Show tables (read by the migration that creates the index)
+SHOW_TIME_INDEX_METHOD = os.environ.get("SHOW_TIME_INDEX_METHOD", "btree")
+
+# On-demand profiling: sample PROFILE_SAMPLE_RATE of requests when
+# FYYUR_PROFILE is set, or any request carrying a signed ?_profile= token
+PROFILE_ENABLED = os.environ.get("FYYUR_PROFILE", "") not in ("", "0")
+PROFILE_SAMPLE_RATE = float(os.environ.get("FYYUR_PROFILE_RATE", "0.01"))
+PROFILE_SECRET = os.environ.get("FYYUR_PROFILE_SECRET")
+# Seconds a ?_profile= token stays valid
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = os.environ.get("FYYUR_PROFILE_DIR", os.path.join(basedir, "profiles"))
+PROFILE_MAX_FILES = 200
+PROFILE_MAX_BYTES = 50 * 1024 * 1024
+
+# Search results are cached per normalized term for this many seconds. Writes
+# invalidate them in every worker through the entity cache's LISTEN/NOTIFY
+# listener (PostgreSQL); without it other workers may serve results up to
+# SEARCH_CACHE_TTL seconds old
+SEARCH_CACHE_TTL = 30
+SEARCH_CACHE_MAXSIZE = 512
+# Concurrent searches for the same term wait at most this many seconds for
+# the one already running, then run the query themselves
+SEARCH_CACHE_WAIT = 10
+
+# Background jobs: workers run in this process when JOB_QUEUE_AUTOSTART is
+# set (always under "python3 app.py"), or separately with "flask jobs-worker"
+JOB_QUEUE_AUTOSTART = os.environ.get("JOB_QUEUE_AUTOSTART", "") not in ("", "0")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_WORKER_MODE = os.environ.get("JOB_WORKER_MODE", "thread")  # or "process"
+JOB_APP_MODULE = "app"
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_INTERVAL = 1.0
+# Seconds after which a "running" job whose worker died is queued again
+JOB_LEASE = 3600
+
+# Jinja bytecode cache, shared by all workers on the host and kept across
+# restarts so templates are only compiled once per deploy
+TEMPLATE_CACHE_DIR = os.environ.get(
+    "TEMPLATE_CACHE_DIR", os.path.join(basedir, ".jinja_cache")
+)
+
+# Venue and artist page data: a per-process LRU in front of a SQLite file
+# shared by the workers on this host, invalidated through LISTEN/NOTIFY
+ENTITY_CACHE_ENABLED = os.environ.get("ENTITY_CACHE", "1") != "0"
+ENTITY_CACHE_PATH = os.environ.get(
+    "ENTITY_CACHE_PATH", os.path.join(basedir, ".entity_cache.sqlite3")
+)
+ENTITY_CACHE_MAXSIZE = 1024
+ENTITY_CACHE_TTL = 300
+
+# Artist/venue matches: shows since this many days ago count as recent
+# activity when ranking, and pages list at most MATCH_LIMIT matches
+MATCH_RECENT_DAYS = 90
+MATCH_LIMIT = 6
+
+# Venues listed per page by /venues/available
+AVAILABLE_VENUES_PER_PAGE = 20
+
+# Most ids /api/v1/batch accepts in one request, across all entity types
+BATCH_MAX_IDS = 300
+
+# Warm-up before /readyz reports ready: open pool connections, compile all
+# templates, request the hottest pages and pg_prewarm the hottest relations
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") != "0"
+WARMUP_POOL_CONNECTIONS = 5
+WARMUP_PATHS = ["/", "/venues", "/artists", "/shows"]
+WARMUP_RELATIONS = [
+    "Venue",
+    "Artist",
+    "Match",
+    "ix_Venue_city_state",
+    "ix_Artist_city_state",
+    "ix_Match_venue_id",
+]
+
+# Response compression: bodies of at least COMPRESSION_MIN_SIZE bytes with
+# one of these content types are sent with brotli (if the brotli package is
+# installed) or gzip, at the given level/quality. Set COMPRESSION=0 to turn
+# it off, e.g. when a proxy in front already compresses.
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION", "1") != "0"
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_TYPES = {
+    "text/html": {"gzip": 6, "br": 5},
+    "application/json": {"gzip": 6, "br": 5},
+    "text/csv": {"gzip": 6, "br": 5},
+    "application/x-ndjson": {"gzip": 6, "br": 5},
+    "text/calendar": {"gzip": 6, "br": 5},
+    "text/plain": {"gzip": 6, "br": 5},
+}
+
+# Admission control: per-process concurrency limits for the expensive routes,
+# by endpoint. Up to "queue" more requests wait at most "timeout" seconds for
+# a slot; the rest get a 503 with Retry-After. Keep the total concurrency below
+# the database pool size plus its overflow so cheap routes still get a
+# connection.
+ADMISSION_ENABLED = os.environ.get("ADMISSION", "1") != "0"
+ADMISSION_LIMITS = {
+    "shows": {"concurrency": 4, "queue": 8, "timeout": 2.0},
+    "venues": {"concurrency": 4, "queue": 8, "timeout": 2.0},
+    "available_venues": {"concurrency": 2, "queue": 4, "timeout": 2.0},
+    "search_venues": {"concurrency": 2, "queue": 4, "timeout": 1.0},
+    "search_artists": {"concurrency": 2, "queue": 4, "timeout": 1.0},
+}
+ADMISSION_RETRY_AFTER = 2
@@ -1,6 +1,12 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
+from wtforms import (
+    StringField,
+    SelectField,
+    SelectMultipleField,
+    DateTimeField,
+    HiddenField,
+)
 from wtforms.validators import DataRequired, AnyOf, URL
 
 
@@ -13,6 +19,8 @@ class ShowForm(FlaskForm):
 
 
 class VenueForm(FlaskForm):
+    # Row version the edit form was rendered from, see edit_venue_submission
+    version = HiddenField("version")
     name = StringField("name", validators=[DataRequired()])
     city = StringField("city", validators=[DataRequired()])
     state = SelectField(
@@ -105,6 +113,8 @@ class VenueForm(FlaskForm):
 
 
 class ArtistForm(FlaskForm):
+    # Row version the edit form was rendered from, see edit_artist_submission
+    version = HiddenField("version")
     name = StringField("name", validators=[DataRequired()])
     city = StringField("city", validators=[DataRequired()])
     state = SelectField(
@@ -0,0 +1,222 @@
+"""Background jobs backed by the Job table.
+
+Handlers are registered with the ``@job`` decorator and queued with
+``JobQueue.enqueue``. A dispatcher thread claims due jobs with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of processes can work
+the same table, and runs them on a thread or process pool. Failed jobs are
+retried with exponential backoff up to their ``max_attempts``.
+"""
+
+import atexit
+import importlib
+import json
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+
+_handlers = {}
+_app = None
+_db = None
+
+
+def job(name):
+    """Register a function as the handler for jobs called ``name``."""
+
+    def register(func):
+        _handlers[name] = func
+        return func
+
+    return register
+
+
+def _initProcess(importName):
+    # Runs once in each pool process before it accepts work
+    os.environ["FYYUR_JOB_CHILD"] = "1"
+    if _app is None:
+        importlib.import_module(importName)
+    else:
+        # Forked children must not reuse the parent's pooled connections
+        with _app.app_context():
+            _db.engine.dispose()
+
+
+def _execute(name, payload):
+    with _app.app_context():
+        return _handlers[name](**payload)
+
+
+class JobQueue:
+    def __init__(self, app=None, db=None, model=None):
+        self.dispatcher = None
+        self.executor = None
+        self.stopping = threading.Event()
+        if app is not None:
+            self.init_app(app, db, model)
+
+    def init_app(self, app, db, model):
+        global _app, _db
+        _app = app
+        _db = db
+        self.app = app
+        self.db = db
+        self.model = model
+
+        @app.cli.command("jobs-worker")
+        def jobs_worker():
+            """Work the job queue in the foreground until interrupted."""
+            self.start()
+            done = threading.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: done.set())
+            click.echo(f"Working jobs with {self.workers} {self.mode} workers")
+            done.wait()
+            click.echo("Finishing running jobs...")
+            self.shutdown()
+
+    @property
+    def workers(self):
+        return self.app.config["JOB_WORKERS"]
+
+    @property
+    def mode(self):
+        return self.app.config["JOB_WORKER_MODE"]
+
+    # Producer side
+    # ----------------------------------------------------------------
+
+    def build(self, name, payload=None, delay=0, max_attempts=None):
+        """Return a new, unsaved Job to add to a session yourself.
+
+        Adding it to the session doing the work that needs it makes the job
+        part of that transaction: it is only queued if the work commits.
+        """
+        if name not in _handlers:
+            raise KeyError(f"No job handler registered for {name!r}")
+        return self.model(
+            name=name,
+            payload=json.dumps(payload or {}),
+            run_after=datetime.utcnow() + timedelta(seconds=delay),
+            max_attempts=max_attempts or self.app.config["JOB_MAX_ATTEMPTS"],
+        )
+
+    def enqueue(self, name, payload=None, delay=0, max_attempts=None):
+        """Queue a job and commit it; returns the new Job."""
+        record = self.build(name, payload, delay, max_attempts)
+        self.db.session.add(record)
+        self.db.session.commit()
+        return record
+
+    # Worker side
+    # ----------------------------------------------------------------
+
+    def start(self):
+        if self.dispatcher is not None or os.environ.get("FYYUR_JOB_CHILD"):
+            return
+        if self.mode == "process":
+            self.executor = ProcessPoolExecutor(
+                self.workers,
+                initializer=_initProcess,
+                initargs=(self.app.config["JOB_APP_MODULE"],),
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix="fyyur-job"
+            )
+        self.slots = threading.Semaphore(self.workers)
+        self.stopping.clear()
+        self.recover()
+        self.dispatcher = threading.Thread(
+            target=self.dispatch, name="fyyur-job-dispatcher", daemon=True
+        )
+        self.dispatcher.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self, wait=True):
+        """Stop claiming jobs and let the ones already running finish."""
+        if self.dispatcher is None:
+            return
+        self.stopping.set()
+        self.dispatcher.join()
+        self.executor.shutdown(wait=wait)
+        self.dispatcher = None
+        self.executor = None
+
+    def recover(self):
+        # Jobs left "running" by a worker that died are put back in the queue
+        lease = datetime.utcnow() - timedelta(seconds=self.app.config["JOB_LEASE"])
+        with self.app.app_context():
+            self.model.query.filter(
+                self.model.status == "running", self.model.updated_at < lease
+            ).update({"status": "queued"}, synchronize_session=False)
+            self.db.session.commit()
+
+    def dispatch(self):
+        poll = self.app.config["JOB_POLL_INTERVAL"]
+        while not self.stopping.is_set():
+            if not self.slots.acquire(timeout=poll):
+                continue
+            try:
+                claimed = self.claim()
+            except Exception:
+                self.app.logger.exception("Claiming a job failed")
+                claimed = None
+            if claimed is None:
+                self.slots.release()
+                self.stopping.wait(poll)
+                continue
+            jobId, name, payload = claimed
+            future = self.executor.submit(_execute, name, payload)
+            future.add_done_callback(
+                lambda future, jobId=jobId: self.complete(jobId, future)
+            )
+
+    def claim(self):
+        Job = self.model
+        with self.app.app_context():
+            record = (
+                Job.query.filter(
+                    Job.status == "queued", Job.run_after <= datetime.utcnow()
+                )
+                .order_by(Job.run_after, Job.id)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if record is None:
+                self.db.session.rollback()
+                return None
+            record.status = "running"
+            record.attempts += 1
+            record.updated_at = datetime.utcnow()
+            claimed = (record.id, record.name, json.loads(record.payload or "{}"))
+            self.db.session.commit()
+            return claimed
+
+    def complete(self, jobId, future):
+        try:
+            error = future.exception()
+            with self.app.app_context():
+                record = self.model.query.get(jobId)
+                record.updated_at = datetime.utcnow()
+                if error is None:
+                    record.status = "done"
+                    record.last_error = None
+                elif record.attempts < record.max_attempts:
+                    record.status = "queued"
+                    record.last_error = repr(error)
+                    record.run_after = datetime.utcnow() + timedelta(
+                        seconds=2 ** record.attempts
+                    )
+                else:
+                    record.status = "failed"
+                    record.last_error = repr(error)
+                self.db.session.commit()
+            if error is not None:
+                self.app.logger.warning("Job %s failed: %r", jobId, error)
+        except Exception:
+            self.app.logger.exception("Recording the result of job %s failed", jobId)
+        finally:
+            self.slots.release()
@@ -0,0 +1,207 @@
+"""Prometheus metrics exposed at /metrics.
+
+Every request is timed from before_request to teardown_request, so all
+handlers in app.py are covered without decorating them. Database and pool
+metrics come from SQLAlchemy engine and pool events, template timings from
+Flask's template signals.
+
+When running several worker processes, point PROMETHEUS_MULTIPROC_DIR at an
+empty directory before the workers start (and wipe it on deploy). Each worker
+then writes its samples there and /metrics aggregates across all of them. With
+gunicorn, also call ``metrics.markProcessDead(worker.pid)`` from the
+``child_exit`` server hook.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from flask.signals import before_render_template, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+REQUEST_LATENCY = Histogram(
+    "fyyur_request_duration_seconds",
+    "Request latency by route",
+    ["endpoint", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "fyyur_requests_in_flight",
+    "Requests currently being handled",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+TEMPLATE_RENDER = Histogram(
+    "fyyur_template_render_seconds", "Template render time", ["template"]
+)
+DB_QUERIES = Histogram(
+    "fyyur_db_query_duration_seconds", "Database statement execution time"
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    "fyyur_db_connections_open",
+    "Connections held by the pool",
+    multiprocess_mode="livesum",
+)
+DB_CONNECTIONS_IN_USE = Gauge(
+    "fyyur_db_connections_in_use",
+    "Connections checked out of the pool",
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "fyyur_cache_requests_total", "Cache lookups by result", ["cache", "result"]
+)
+ADMISSION_SHED = Counter(
+    "fyyur_admission_shed_total",
+    "Requests rejected by admission control",
+    ["endpoint", "reason"],
+)
+ADMISSION_WAITING = Gauge(
+    "fyyur_admission_waiting",
+    "Requests waiting for an admission slot",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT = Histogram(
+    "fyyur_admission_wait_seconds",
+    "Time queued requests waited for an admission slot",
+    ["endpoint"],
+)
+
+
+def recordCache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def recordShed(endpoint, reason):
+    ADMISSION_SHED.labels(endpoint, reason).inc()
+
+
+def recordAdmissionWaiting(endpoint, change):
+    ADMISSION_WAITING.labels(endpoint).inc(change)
+
+
+def recordAdmissionWait(endpoint, seconds):
+    ADMISSION_WAIT.labels(endpoint).observe(seconds)
+
+
+def markProcessDead(pid):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+# Requests
+# ----------------------------------------------------------------
+
+
+def startRequest():
+    endpoint = request.endpoint or "none"
+    g.metricsStarted = time.perf_counter()
+    g.metricsInFlight = REQUESTS_IN_FLIGHT.labels(endpoint)
+    g.metricsInFlight.inc()
+
+
+def recordResponse(response):
+    g.metricsStatus = response.status_code
+    return response
+
+
+def finishRequest(exc=None):
+    started = g.pop("metricsStarted", None)
+    if started is None:
+        return
+    g.pop("metricsInFlight").dec()
+    status = g.pop("metricsStatus", 500)
+    REQUEST_LATENCY.labels(
+        request.endpoint or "none", request.method, str(status)
+    ).observe(time.perf_counter() - started)
+
+
+# Templates
+# ----------------------------------------------------------------
+
+
+def startRender(sender, template, context, **extra):
+    g.metricsRenderStarted = time.perf_counter()
+
+
+def finishRender(sender, template, context, **extra):
+    started = g.pop("metricsRenderStarted", None)
+    if started is not None:
+        TEMPLATE_RENDER.labels(template.name or "string").observe(
+            time.perf_counter() - started
+        )
+
+
+# Database
+# ----------------------------------------------------------------
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def startQuery(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metricsQueryStarted", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def finishQuery(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERIES.observe(time.perf_counter() - conn.info["metricsQueryStarted"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def failQuery(context):
+    if context.connection is not None:
+        started = context.connection.info.get("metricsQueryStarted")
+        if started:
+            started.pop()
+
+
+@event.listens_for(Pool, "connect")
+def connectionOpened(dbapiConnection, connectionRecord):
+    DB_CONNECTIONS_OPEN.inc()
+
+
+@event.listens_for(Pool, "close")
+def connectionClosed(dbapiConnection, connectionRecord):
+    DB_CONNECTIONS_OPEN.dec()
+
+
+@event.listens_for(Pool, "checkout")
+def connectionCheckedOut(dbapiConnection, connectionRecord, connectionProxy):
+    DB_CONNECTIONS_IN_USE.inc()
+
+
+@event.listens_for(Pool, "checkin")
+def connectionCheckedIn(dbapiConnection, connectionRecord):
+    DB_CONNECTIONS_IN_USE.dec()
+
+
+# Endpoint
+# ----------------------------------------------------------------
+
+
+def metricsView():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    app.before_request(startRequest)
+    app.after_request(recordResponse)
+    app.teardown_request(finishRequest)
+    before_render_template.connect(startRender, app)
+    template_rendered.connect(finishRender, app)
+    app.add_url_rule("/metrics", "metrics", metricsView)
@@ -0,0 +1,28 @@
+"""Show(venue_id, start_time) index for venue availability
+
+Revision ID: 0c4e7a9d2b53
+Revises: b6d3e8f5a217
+Create Date: 2026-10-19 16:08:41.530912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0c4e7a9d2b53"
+down_revision = "b6d3e8f5a217"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves the "any show at this venue in the window" anti-join; also covers
+    # every lookup ix_Show_venue_id did, so that index is replaced
+    op.create_index("ix_Show_venue_id_start_time", "Show", ["venue_id", "start_time"])
+    op.drop_index("ix_Show_venue_id", table_name="Show")
+
+
+def downgrade():
+    op.create_index("ix_Show_venue_id", "Show", ["venue_id"])
+    op.drop_index("ix_Show_venue_id_start_time", table_name="Show")
@@ -0,0 +1,51 @@
+"""cascade Show deletes from Venue and Artist
+
+Revision ID: 5e7f0b2d8a16
+Revises: d4a8c2e91f07
+Create Date: 2026-10-19 10:41:52.207736
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e7f0b2d8a16"
+down_revision = "d4a8c2e91f07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint("Show_artist_id_fkey", "Show", type_="foreignkey")
+    op.drop_constraint("Show_venue_id_fkey", "Show", type_="foreignkey")
+    op.create_foreign_key(
+        "Show_artist_id_fkey",
+        "Show",
+        "Artist",
+        ["artist_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
+    op.create_foreign_key(
+        "Show_venue_id_fkey",
+        "Show",
+        "Venue",
+        ["venue_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
+    # Cascading deletes look shows up by venue/artist, so index both columns
+    op.create_index("ix_Show_artist_id", "Show", ["artist_id"])
+    op.create_index("ix_Show_venue_id", "Show", ["venue_id"])
+
+
+def downgrade():
+    op.drop_index("ix_Show_venue_id", table_name="Show")
+    op.drop_index("ix_Show_artist_id", table_name="Show")
+    op.drop_constraint("Show_venue_id_fkey", "Show", type_="foreignkey")
+    op.drop_constraint("Show_artist_id_fkey", "Show", type_="foreignkey")
+    op.create_foreign_key(
+        "Show_artist_id_fkey", "Show", "Artist", ["artist_id"], ["id"]
+    )
+    op.create_foreign_key("Show_venue_id_fkey", "Show", "Venue", ["venue_id"], ["id"])
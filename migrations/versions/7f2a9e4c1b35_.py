@@ -0,0 +1,70 @@
+"""notify triggers for entity cache invalidation
+
+Revision ID: 7f2a9e4c1b35
+Revises: e81b5c7d2f90
+Create Date: 2026-10-19 13:37:21.804512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7f2a9e4c1b35"
+down_revision = "e81b5c7d2f90"
+branch_labels = None
+depends_on = None
+
+# Payloads are the entity cache keys ("venue:3", "artist:5") whose pages
+# changed. Postgres folds identical payloads sent within one transaction.
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_notify_entity() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'Show' THEN
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM pg_notify('fyyur_entity', 'venue:' || NEW.venue_id);
+            PERFORM pg_notify('fyyur_entity', 'artist:' || NEW.artist_id);
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM pg_notify('fyyur_entity', 'venue:' || OLD.venue_id);
+            PERFORM pg_notify('fyyur_entity', 'artist:' || OLD.artist_id);
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('fyyur_entity', lower(TG_TABLE_NAME) || ':' || OLD.id);
+    ELSE
+        PERFORM pg_notify('fyyur_entity', lower(TG_TABLE_NAME) || ':' || NEW.id);
+        -- Artist pages list venue names and images, and vice versa
+        IF TG_OP = 'UPDATE' AND TG_TABLE_NAME = 'Venue'
+           AND (NEW.name, NEW.image_link) IS DISTINCT FROM (OLD.name, OLD.image_link)
+        THEN
+            PERFORM pg_notify('fyyur_entity', 'artist:' || artist_id)
+            FROM (SELECT DISTINCT artist_id FROM "Show" WHERE venue_id = NEW.id) s;
+        ELSIF TG_OP = 'UPDATE' AND TG_TABLE_NAME = 'Artist'
+           AND (NEW.name, NEW.image_link) IS DISTINCT FROM (OLD.name, OLD.image_link)
+        THEN
+            PERFORM pg_notify('fyyur_entity', 'venue:' || venue_id)
+            FROM (SELECT DISTINCT venue_id FROM "Show" WHERE artist_id = NEW.id) s;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+TABLES = ("Venue", "Artist", "Show")
+
+
+def upgrade():
+    op.execute(NOTIFY_FUNCTION)
+    for table in TABLES:
+        op.execute(
+            f'CREATE TRIGGER "{table}_notify_entity" '
+            f'AFTER INSERT OR UPDATE OR DELETE ON "{table}" '
+            "FOR EACH ROW EXECUTE PROCEDURE fyyur_notify_entity()"
+        )
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER "{table}_notify_entity" ON "{table}"')
+    op.execute("DROP FUNCTION fyyur_notify_entity()")
@@ -0,0 +1,31 @@
+"""index Show.start_time for date range queries
+
+Revision ID: 9b1e6f3a7c42
+Revises: c60c836458d2
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sys
+
+sys.path.append("../../")
+import app
+
+
+# revision identifiers, used by Alembic.
+revision = "9b1e6f3a7c42"
+down_revision = "c60c836458d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    method = app.app.config["SHOW_TIME_INDEX_METHOD"]
+    op.create_index(
+        "ix_Show_start_time", "Show", ["start_time"], postgresql_using=method,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_Show_start_time", table_name="Show")
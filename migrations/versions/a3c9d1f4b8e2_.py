@@ -0,0 +1,39 @@
+"""Job table for the background job queue
+
+Revision ID: a3c9d1f4b8e2
+Revises: 5e7f0b2d8a16
+Create Date: 2026-10-19 11:26:05.930174
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a3c9d1f4b8e2"
+down_revision = "5e7f0b2d8a16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "Job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=120), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=True),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("run_after", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_Job_status_run_after", "Job", ["status", "run_after"])
+
+
+def downgrade():
+    op.drop_index("ix_Job_status_run_after", table_name="Job")
+    op.drop_table("Job")
@@ -0,0 +1,40 @@
+"""Match table and city/state indexes for artist-venue matching
+
+Revision ID: b6d3e8f5a217
+Revises: 7f2a9e4c1b35
+Create Date: 2026-10-19 14:52:09.377620
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b6d3e8f5a217"
+down_revision = "7f2a9e4c1b35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "Match",
+        sa.Column("artist_id", sa.Integer(), nullable=False),
+        sa.Column("venue_id", sa.Integer(), nullable=False),
+        sa.Column("genre_overlap", sa.Integer(), nullable=False),
+        sa.Column("artist_recent_shows", sa.Integer(), nullable=False),
+        sa.Column("venue_recent_shows", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["artist_id"], ["Artist.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["venue_id"], ["Venue.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("artist_id", "venue_id"),
+    )
+    op.create_index("ix_Match_venue_id", "Match", ["venue_id"])
+    op.create_index("ix_Venue_city_state", "Venue", ["city", "state"])
+    op.create_index("ix_Artist_city_state", "Artist", ["city", "state"])
+
+
+def downgrade():
+    op.drop_index("ix_Artist_city_state", table_name="Artist")
+    op.drop_index("ix_Venue_city_state", table_name="Venue")
+    op.drop_index("ix_Match_venue_id", table_name="Match")
+    op.drop_table("Match")
@@ -0,0 +1,32 @@
+"""version columns for optimistic concurrency on Venue and Artist
+
+Revision ID: d4a8c2e91f07
+Revises: 9b1e6f3a7c42
+Create Date: 2026-10-19 10:03:17.442918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d4a8c2e91f07"
+down_revision = "9b1e6f3a7c42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "Venue",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column(
+        "Artist",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("Artist", "version")
+    op.drop_column("Venue", "version")
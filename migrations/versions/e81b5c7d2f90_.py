@@ -0,0 +1,113 @@
+"""partition Show by start_time range
+
+Revision ID: e81b5c7d2f90
+Revises: a3c9d1f4b8e2
+Create Date: 2026-10-19 12:08:44.561390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+import sys
+
+sys.path.append("../../")
+import app
+import partitions
+
+
+# revision identifiers, used by Alembic.
+revision = "e81b5c7d2f90"
+down_revision = "a3c9d1f4b8e2"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+
+def createShowIndexes():
+    method = app.app.config["SHOW_TIME_INDEX_METHOD"]
+    op.create_index(
+        "ix_Show_start_time", "Show", ["start_time"], postgresql_using=method,
+    )
+    op.create_index("ix_Show_artist_id", "Show", ["artist_id"])
+    op.create_index("ix_Show_venue_id", "Show", ["venue_id"])
+
+
+def moveShowAside():
+    # Free up the table, index and sequence names for the new Show table
+    op.drop_index("ix_Show_start_time", table_name="Show")
+    op.drop_index("ix_Show_artist_id", table_name="Show")
+    op.drop_index("ix_Show_venue_id", table_name="Show")
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_old"')
+    op.execute(
+        'ALTER TABLE "Show_old" RENAME CONSTRAINT "Show_pkey" TO "Show_old_pkey"'
+    )
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+
+
+def upgrade():
+    conn = op.get_bind()
+    moveShowAside()
+    # The partition key has to be part of the primary key
+    op.execute(
+        """
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'),
+            artist_id integer NOT NULL,
+            venue_id integer NOT NULL,
+            start_time timestamp without time zone NOT NULL,
+            CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time),
+            CONSTRAINT "Show_artist_id_fkey" FOREIGN KEY (artist_id)
+                REFERENCES "Artist" (id) ON DELETE CASCADE,
+            CONSTRAINT "Show_venue_id_fkey" FOREIGN KEY (venue_id)
+                REFERENCES "Venue" (id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (start_time)
+        """
+    )
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+
+    today = datetime.utcnow().date()
+    first, last = conn.execute(
+        sa.text('SELECT min(start_time), max(start_time) FROM "Show_old"')
+    ).first()
+    # Cover every existing show, however far ahead it is booked, so none
+    # lands in the default partition
+    ahead = partitions.addMonths(today, MONTHS_AHEAD)
+    partitions.createPartitions(
+        conn, first or today, max(ahead, last.date() if last else ahead)
+    )
+    partitions.createDefaultPartition(conn)
+    createShowIndexes()
+
+    op.execute(
+        'INSERT INTO "Show" (id, artist_id, venue_id, start_time) '
+        'SELECT id, artist_id, venue_id, start_time FROM "Show_old"'
+    )
+    op.drop_table("Show_old")
+
+
+def downgrade():
+    moveShowAside()
+    op.create_table(
+        "Show",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('\"Show_id_seq\"')"),
+            nullable=False,
+        ),
+        sa.Column("artist_id", sa.Integer(), nullable=False),
+        sa.Column("venue_id", sa.Integer(), nullable=False),
+        sa.Column("start_time", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["artist_id"], ["Artist.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["venue_id"], ["Venue.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    createShowIndexes()
+    op.execute(
+        'INSERT INTO "Show" (id, artist_id, venue_id, start_time) '
+        'SELECT id, artist_id, venue_id, start_time FROM "Show_old"'
+    )
+    # Dropping the partitioned table drops all of its partitions
+    op.drop_table("Show_old")
@@ -0,0 +1,161 @@
+"""Monthly range partitions of the Show table (PostgreSQL 11+).
+
+Show is partitioned by ``start_time`` with one partition per month, named
+``Show_y2020m05``, plus a ``Show_default`` partition. Queries that bound
+``start_time`` (upcoming shows, date ranges) only scan the matching months.
+
+Run ``flask show-partitions`` regularly (e.g. daily from cron) to create
+partitions ahead of time, so new shows never land in the default partition,
+and optionally to detach old months into an archive schema.
+"""
+
+import re
+from datetime import date, datetime
+
+import click
+from sqlalchemy import text
+
+PARENT = "Show"
+COLUMNS = "id, artist_id, venue_id, start_time"
+PARTITION_NAME = re.compile(r"^Show_y(\d{4})m(\d{2})$")
+
+
+def monthStart(value):
+    return date(value.year, value.month, 1)
+
+
+def addMonths(month, count):
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def partitionName(month):
+    return f"{PARENT}_y{month.year}m{month.month:02d}"
+
+
+def listPartitions(conn):
+    return [
+        row[0]
+        for row in conn.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = :parent ORDER BY child.relname"
+            ),
+            {"parent": PARENT},
+        )
+    ]
+
+
+def createPartitions(conn, first, last):
+    """Create monthly partitions for every month from first to last.
+
+    Shows that already landed in the default partition for a new month are
+    moved into it: PostgreSQL refuses to create a partition whose rows sit
+    in the default one, so the default partition is detached while they are
+    moved and attached again afterwards.
+    """
+    existing = set(listPartitions(conn))
+    default = f"{PARENT}_default"
+    created = []
+    month = monthStart(first)
+    while month <= monthStart(last):
+        name = partitionName(month)
+        bounds = {"start": month, "end": addMonths(month, 1)}
+        inMonth = "start_time >= :start AND start_time < :end"
+        stranded = (
+            name not in existing
+            and default in existing
+            and conn.execute(
+                text(f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE {inMonth})'),
+                bounds,
+            ).scalar()
+        )
+        if stranded:
+            conn.execute(text(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{default}"'))
+        conn.execute(
+            text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{PARENT}" '
+                f"FOR VALUES FROM ('{month}') TO ('{addMonths(month, 1)}')"
+            )
+        )
+        if stranded:
+            conn.execute(
+                text(
+                    f'INSERT INTO "{PARENT}" ({COLUMNS}) '
+                    f'SELECT {COLUMNS} FROM "{default}" WHERE {inMonth}'
+                ),
+                bounds,
+            )
+            conn.execute(text(f'DELETE FROM "{default}" WHERE {inMonth}'), bounds)
+            conn.execute(
+                text(f'ALTER TABLE "{PARENT}" ATTACH PARTITION "{default}" DEFAULT')
+            )
+        created.append(name)
+        month = addMonths(month, 1)
+    return created
+
+
+def createDefaultPartition(conn):
+    conn.execute(
+        text(
+            f'CREATE TABLE IF NOT EXISTS "{PARENT}_default" '
+            f'PARTITION OF "{PARENT}" DEFAULT'
+        )
+    )
+
+
+def detachPartitions(conn, before, archiveSchema=None, drop=False):
+    """Detach monthly partitions that end on or before ``before``.
+
+    Detached partitions are moved to ``archiveSchema``, or dropped when
+    ``drop`` is set. Returns the names of the partitions detached.
+    """
+    detached = []
+    for name in listPartitions(conn):
+        match = PARTITION_NAME.match(name)
+        if match is None:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if addMonths(month, 1) > monthStart(before):
+            continue
+        conn.execute(text(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{name}"'))
+        if drop:
+            conn.execute(text(f'DROP TABLE "{name}"'))
+        elif archiveSchema:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{archiveSchema}"'))
+            conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{archiveSchema}"'))
+        detached.append(name)
+    return detached
+
+
+def init_app(app, db):
+    @app.cli.command("show-partitions")
+    @click.option(
+        "--ahead", default=3, show_default=True, help="Months to create ahead."
+    )
+    @click.option(
+        "--retain",
+        type=int,
+        help="Months of past shows to keep; older partitions are detached.",
+    )
+    @click.option(
+        "--archive-schema",
+        default="archive",
+        show_default=True,
+        help="Schema detached partitions are moved to.",
+    )
+    @click.option("--drop", is_flag=True, help="Drop detached partitions instead.")
+    def show_partitions(ahead, retain, archive_schema, drop):
+        """Create future Show partitions and detach old ones."""
+        if db.engine.dialect.name != "postgresql":
+            raise click.ClickException("Show partitions require PostgreSQL.")
+        today = datetime.utcnow().date()
+        with db.engine.begin() as conn:
+            for name in createPartitions(conn, today, addMonths(today, ahead)):
+                click.echo(f"ensured {name}")
+            if retain is not None:
+                cutoff = addMonths(monthStart(today), -retain)
+                for name in detachPartitions(conn, cutoff, archive_schema, drop):
+                    click.echo(f"detached {name}")
@@ -0,0 +1,188 @@
+"""On-demand request profiling.
+
+A sampling profiler that can be switched on for a fraction of requests with
+the FYYUR_PROFILE environment flag, or for a single request with a signed
+``?_profile=<token>`` query parameter (see ``flask profile-token``).
+
+Each profiled request is written to PROFILE_DIR as a ``.folded`` file in the
+collapsed-stack format read by flamegraph.pl, speedscope and inferno. The
+root frame of every stack is the category the sample was attributed to
+(``sql``, ``render`` or ``python``), so the flame graph splits time spent in
+the database, in Jinja templates and in view code at the top level.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import click
+from flask import g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+SQL_MODULES = ("sqlalchemy", "psycopg2")
+RENDER_MODULES = ("jinja2",)
+
+
+def frameLabel(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def categorize(filenames):
+    # The innermost match wins so a query issued from inside a template
+    # counts as SQL time rather than render time.
+    for filename in reversed(filenames):
+        if any(name in filename for name in SQL_MODULES):
+            return "sql"
+        if filename.endswith(".html") or any(
+            name in filename for name in RENDER_MODULES
+        ):
+            return "render"
+    return "python"
+
+
+class Sampler(threading.Thread):
+    """Samples the call stack of one thread at a fixed interval."""
+
+    def __init__(self, threadId, interval):
+        super().__init__(name="fyyur-profiler", daemon=True)
+        self.threadId = threadId
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            if frame is None:
+                continue
+            labels = []
+            filenames = []
+            while frame is not None:
+                labels.append(frameLabel(frame))
+                filenames.append(frame.f_code.co_filename)
+                frame = frame.f_back
+            labels.reverse()
+            filenames.reverse()
+            category = categorize(filenames)
+            self.categories[category] += 1
+            self.stacks[";".join([category] + labels)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.serializer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config["PROFILE_DIR"]
+        self.serializer = URLSafeTimedSerializer(
+            app.config["PROFILE_SECRET"] or app.secret_key, salt="fyyur-profile"
+        )
+        app.before_request(self.start)
+        app.teardown_request(self.finish)
+
+        @app.cli.command("profile-token")
+        def profile_token():
+            """Print a token that forces profiling via ?_profile=<token>."""
+            click.echo(self.token())
+
+    def token(self):
+        return self.serializer.dumps("profile")
+
+    def wanted(self):
+        token = request.args.get("_profile")
+        if token:
+            try:
+                # Tokens end up in access logs, so they expire
+                return (
+                    self.serializer.loads(
+                        token, max_age=self.app.config["PROFILE_TOKEN_MAX_AGE"]
+                    )
+                    == "profile"
+                )
+            except BadSignature:
+                return False
+        config = self.app.config
+        return (
+            config["PROFILE_ENABLED"]
+            and random.random() < config["PROFILE_SAMPLE_RATE"]
+        )
+
+    def start(self):
+        if not self.wanted():
+            return
+        sampler = Sampler(threading.get_ident(), self.app.config["PROFILE_INTERVAL"])
+        g.profileSampler = sampler
+        g.profileStarted = time.perf_counter()
+        sampler.start()
+
+    def finish(self, exc=None):
+        sampler = g.pop("profileSampler", None)
+        if sampler is None:
+            return
+        sampler.stop()
+        elapsed = time.perf_counter() - g.pop("profileStarted")
+        total = sum(sampler.categories.values()) or 1
+        split = {
+            category: elapsed * sampler.categories[category] / total
+            for category in ("sql", "python", "render")
+        }
+        path = self.write(sampler.stacks)
+        self.app.logger.info(
+            "profiled %s %s in %.1fms (sql %.1fms, python %.1fms, render %.1fms) -> %s",
+            request.method,
+            request.path,
+            elapsed * 1000,
+            split["sql"] * 1000,
+            split["python"] * 1000,
+            split["render"] * 1000,
+            path,
+        )
+
+    def write(self, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        endpoint = (request.endpoint or "unknown").replace(".", "_")
+        name = f"{time.time():.6f}-{os.getpid()}-{endpoint}.folded"
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as profile:
+            for stack, count in stacks.items():
+                profile.write(f"{stack} {count}\n")
+        self.prune()
+        return path
+
+    def prune(self):
+        # Keep disk use bounded: drop the oldest profiles first
+        config = self.app.config
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".folded"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        totalBytes = sum(size for _, size, _ in entries)
+        while entries and (
+            len(entries) > config["PROFILE_MAX_FILES"]
+            or totalBytes > config["PROFILE_MAX_BYTES"]
+        ):
+            _, size, path = entries.pop(0)
+            totalBytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
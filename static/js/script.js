@@ -2,3 +2,17 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+$(function () {
+  $(".delete-button").on("click", function () {
+    var url = $(this).data("url");
+    if (!window.confirm("Delete this record and all of its shows?")) {
+      return;
+    }
+    // Don't follow the redirect here: rendering the home page inside fetch
+    // would consume the flashed message before the browser navigates.
+    fetch(url, { method: "DELETE", redirect: "manual" }).then(function () {
+      window.location = "/";
+    });
+  });
+});
@@ -0,0 +1,61 @@
+"""Run the app against an in-memory SQLite database.
+
+config.py reads the environment when app.py is imported, so it is set up
+before the import. ``pytest --benchmarks`` runs the benchmarks at full size;
+without it they run on small data sets as ordinary tests.
+"""
+
+import os
+
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["WARMUP_ON_START"] = "0"
+os.environ["ENTITY_CACHE"] = "0"
+os.environ["JOB_QUEUE_AUTOSTART"] = "0"
+
+import pytest
+
+from app import app as flaskApp, db, searchCache
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmarks", action="store_true", help="Run benchmarks at full size."
+    )
+
+
+@pytest.fixture
+def app():
+    flaskApp.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flaskApp.app_context():
+        db.create_all()
+        searchCache.clear()
+        yield flaskApp
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def fileDatabase(app, tmp_path):
+    # For tests using several threads: each needs its own connection, which
+    # the shared in-memory database can't give them
+    saved = {
+        key: app.config[key]
+        for key in ("SQLALCHEMY_DATABASE_URI", "SQLALCHEMY_ENGINE_OPTIONS")
+    }
+    db.session.remove()
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'fyyur.db'}"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}}
+    db.create_all()
+    yield
+    db.session.remove()
+    app.config.update(saved)
+
+
+@pytest.fixture
+def fullSize(request):
+    return request.config.getoption("--benchmarks")
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from app import Artist, GenreType, Show, Venue, db
+
+
+def addVenue(**values):
+    values.setdefault("name", "The Musical Hop")
+    values.setdefault("city", "San Francisco")
+    values.setdefault("state", "CA")
+    values.setdefault("genres", [GenreType.jazz])
+    values.setdefault("seeking_talent", True)
+    venue = Venue(**values)
+    db.session.add(venue)
+    db.session.commit()
+    return venue
+
+
+def addArtist(**values):
+    values.setdefault("name", "Guns N Petals")
+    values.setdefault("city", "San Francisco")
+    values.setdefault("state", "CA")
+    values.setdefault("genres", [GenreType.jazz])
+    values.setdefault("seeking_venue", True)
+    artist = Artist(**values)
+    db.session.add(artist)
+    db.session.commit()
+    return artist
+
+
+def addShow(artist, venue, startTime=datetime(2035, 6, 1, 20)):
+    show = Show(artist_id=artist.id, venue_id=venue.id, start_time=startTime)
+    db.session.add(show)
+    db.session.commit()
+    return show
+
+
+def insertRows(model, rows, batchSize=50000):
+    # Core INSERTs for building large data sets quickly
+    for start in range(0, len(rows), batchSize):
+        db.session.execute(model.__table__.insert(), rows[start : start + batchSize])
+    db.session.commit()
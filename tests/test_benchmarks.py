@@ -0,0 +1,275 @@
+"""Benchmarks, run on small data sets unless pytest is given --benchmarks.
+
+Timings are printed; run with -s to see them.
+"""
+
+import gzip
+import random
+import re
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from flask import render_template, render_template_string
+
+import compression
+from app import GenreType, Show, Venue
+from tests.factories import addArtist, insertRows
+
+
+def timed(func, repeat=5):
+    # Returns the last result and the median wall time in seconds
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return result, statistics.median(times)
+
+
+def report(name, **values):
+    print(f"\n{name}: " + ", ".join(f"{key}={value}" for key, value in values.items()))
+
+
+def test_available_venues_latency(client, fullSize):
+    venueCount, showCount = (10000, 1000000) if fullSize else (500, 20000)
+    genres = list(GenreType)
+    insertRows(
+        Venue,
+        [
+            {
+                "id": venueId,
+                "name": f"Venue {venueId}",
+                "city": f"City {venueId % 50}",
+                "state": "CA",
+                "genres": [genres[venueId % len(genres)]],
+                "version": 1,
+            }
+            for venueId in range(1, venueCount + 1)
+        ],
+    )
+    rng = random.Random(0)
+    first = datetime(2035, 1, 1, 20)
+    shows = [
+        {
+            "artist_id": 1,
+            "venue_id": rng.randint(1, venueCount),
+            "start_time": first + timedelta(days=rng.randrange(365)),
+        }
+        for _ in range(showCount)
+    ]
+    addArtist(id=1)
+    insertRows(Show, shows)
+
+    windowStart, windowEnd = datetime(2035, 6, 1, 18), datetime(2035, 6, 2, 2)
+    busy = {
+        show["venue_id"]
+        for show in shows
+        if windowStart <= show["start_time"] < windowEnd
+    }
+    expected = sum(
+        1
+        for venueId in range(1, venueCount + 1)
+        if venueId % 50 == 7 and venueId not in busy
+    )
+    url = (
+        "/venues/available?city=City 7&state=CA"
+        "&from=2035-06-01T18:00&to=2035-06-02T02:00"
+    )
+    response, latency = timed(lambda: client.get(url))
+    total = int(re.search(rb"(\d+) venues? without", response.data).group(1))
+    assert total == expected
+    _, genreLatency = timed(lambda: client.get(url + "&genre=Jazz"))
+    report(
+        "available venues",
+        venues=venueCount,
+        shows=showCount,
+        free=total,
+        latency_ms=round(latency * 1000, 1),
+        with_genre_ms=round(genreLatency * 1000, 1),
+    )
+    if fullSize:
+        assert latency < 0.5
+
+
+def test_delete_venue_latency(client, fullSize):
+    showCount = 100000 if fullSize else 2000
+    artist = addArtist()
+    insertRows(Venue, [{"id": 1, "name": "Doomed", "version": 1}])
+    insertRows(Venue, [{"id": 2, "name": "Kept", "version": 1}])
+    first = datetime(2035, 1, 1, 20)
+    # The venue being deleted has showCount shows, the other one a tenth
+    insertRows(
+        Show,
+        [
+            {
+                "artist_id": artist.id,
+                "venue_id": venueId,
+                "start_time": first + timedelta(hours=number),
+            }
+            for venueId, count in ((1, showCount), (2, showCount // 10))
+            for number in range(count)
+        ],
+    )
+    started = time.perf_counter()
+    response = client.delete("/venues/1")
+    latency = time.perf_counter() - started
+
+    assert response.status_code == 303
+    assert Show.query.filter(Show.venue_id == 1).count() == 0
+    assert Show.query.filter(Show.venue_id == 2).count() == showCount // 10
+    report(
+        "delete venue",
+        shows=showCount,
+        latency_ms=round(latency * 1000, 1),
+    )
+
+
+# The listing templates as they were before the loops moved into
+# macros/listings.html, to compare against
+INLINE_SHOWS = """{% extends 'layouts/main.html' %}
+{% block content %}
+<div class="row shows">
+    {%for show in shows %}
+    <div class="col-sm-4">
+        <div class="tile tile-show">
+            <img src="{{ show.artist_image_link }}" alt="Artist Image" />
+            <h4>{{ show.start_time|datetime('full') }}</h4>
+            <h5><a href="/artists/{{ show.artist_id }}">{{ show.artist_name }}</a></h5>
+            <p>playing at</p>
+            <h5><a href="/venues/{{ show.venue_id }}">{{ show.venue_name }}</a></h5>
+        </div>
+    </div>
+    {% endfor %}
+</div>
+{% endblock %}"""
+
+INLINE_VENUES = """{% extends 'layouts/main.html' %}
+{% block content %}
+{% for area in areas %}
+<h3>{{ area.city }}, {{ area.state }}</h3>
+    <ul class="items">
+        {% for venue in area.venues %}
+        <li>
+            <a href="/venues/{{ venue.id }}">
+                <i class="fas fa-music"></i>
+                <div class="item">
+                    <h5>{{ venue.name }}</h5>
+                </div>
+            </a>
+        </li>
+        {% endfor %}
+    </ul>
+{% endfor %}
+{% endblock %}"""
+
+
+def compareRenders(app, name, template, inline, marker, **context):
+    with app.test_request_context():
+        # Compile both outside the timings
+        macroHtml = render_template(template, **context)
+        inlineHtml = render_template_string(inline, **context)
+        assert macroHtml.count(marker) == inlineHtml.count(marker)
+        _, macroTime = timed(lambda: render_template(template, **context), 3)
+        _, inlineTime = timed(lambda: render_template_string(inline, **context), 3)
+    report(
+        name,
+        macros_ms=round(macroTime * 1000, 1),
+        inline_ms=round(inlineTime * 1000, 1),
+        speedup=round(inlineTime / macroTime, 2),
+    )
+
+
+def test_listing_render_time(app, fullSize):
+    rows = 10000 if fullSize else 500
+    shows = [
+        {
+            "venue_id": number % 100,
+            "venue_name": f"Venue {number % 100}",
+            "artist_id": number,
+            "artist_name": f"Artist {number}",
+            "artist_image_link": f"https://example.com/{number}.jpg",
+            "start_time": "2035-06-01T20:00:00.000000Z",
+        }
+        for number in range(rows)
+    ]
+    compareRenders(
+        app, "shows.html", "pages/shows.html", INLINE_SHOWS, "tile-show", shows=shows
+    )
+    areas = [
+        {
+            "city": f"City {city}",
+            "state": "CA",
+            "venues": [
+                {"id": city * 100 + number, "name": f"Venue {number}"}
+                for number in range(rows // 100)
+            ],
+        }
+        for city in range(100)
+    ]
+    compareRenders(
+        app, "venues.html", "pages/venues.html", INLINE_VENUES, "<li>", areas=areas
+    )
+
+
+def compressionCost(name, body):
+    # CPU time and size for each encoding and level on one response body
+    candidates = [("gzip", level) for level in (1, 6, 9)]
+    if compression.brotli is not None:
+        candidates += [("br", quality) for quality in (1, 5, 9, 11)]
+    for encoding, level in candidates:
+
+        def compress():
+            compressor = compression.COMPRESSORS[encoding](level)
+            return compressor.compress(body) + compressor.finish()
+
+        times = []
+        for _ in range(3):
+            started = time.process_time()
+            compressed = compress()
+            times.append(time.process_time() - started)
+        report(
+            f"{name} {encoding}:{level}",
+            bytes=len(body),
+            compressed=len(compressed),
+            ratio=round(len(body) / len(compressed), 1),
+            cpu_ms=round(statistics.median(times) * 1000, 2),
+        )
+
+
+def test_compression_tradeoff(client, fullSize):
+    showCount = 10000 if fullSize else 500
+    insertRows(
+        Venue,
+        [
+            {
+                "id": venueId,
+                "name": f"Venue {venueId}",
+                "city": f"City {venueId % 20}",
+                "state": "CA",
+                "genres": [GenreType.jazz],
+                "version": 1,
+            }
+            for venueId in range(1, 101)
+        ],
+    )
+    addArtist(id=1, image_link="https://example.com/artist.jpg")
+    first = datetime(2035, 1, 1, 20)
+    insertRows(
+        Show,
+        [
+            {
+                "artist_id": 1,
+                "venue_id": number % 100 + 1,
+                "start_time": first + timedelta(hours=number),
+            }
+            for number in range(showCount)
+        ],
+    )
+    for path in ("/shows", "/venues", "/export/shows.csv", "/export/shows.jsonl"):
+        plain = client.get(path)
+        assert "Content-Encoding" not in plain.headers
+        compressed = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert compressed.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(compressed.data) == plain.data
+        compressionCost(path, plain.data)
@@ -0,0 +1,197 @@
+import sqlite3
+import threading
+import time
+
+from cache import ChangeListener, EntityCache, SearchCache
+
+
+def test_concurrent_lookups_compute_once():
+    cache = SearchCache(ttl=30, maxsize=10, wait=10)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute(term):
+        calls.append(term)
+        started.set()
+        release.wait(5)
+        return {"term": term}
+
+    results = []
+
+    def search():
+        results.append(cache.get("venues", "  Jazz ", compute))
+
+    threads = [threading.Thread(target=search) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # Give the others time to join the flight before it lands
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == ["jazz"]
+    assert results == [{"term": "jazz"}] * 20
+
+
+def test_followers_stop_waiting_for_a_stuck_leader():
+    cache = SearchCache(ttl=30, maxsize=10, wait=0.05)
+    started = threading.Event()
+    release = threading.Event()
+
+    def stuck(term):
+        started.set()
+        release.wait(5)
+        return "leader"
+
+    leader = threading.Thread(target=cache.get, args=("venues", "jazz", stuck))
+    leader.start()
+    assert started.wait(5)
+    began = time.monotonic()
+    assert cache.get("venues", "jazz", lambda term: "follower") == "follower"
+    assert time.monotonic() - began < 1
+    release.set()
+    leader.join()
+    # The leader's result is the one cached
+    assert cache.get("venues", "jazz", lambda term: "again") == "leader"
+
+
+def entityCache(tmp_path, ttl=300):
+    cache = EntityCache(str(tmp_path / "entities.sqlite3"), maxsize=10, ttl=ttl)
+    cache.live = True
+    return cache
+
+
+def builder(*values, validUntil=None):
+    # build() returning each of values in turn, counting the calls
+    calls = []
+
+    def build():
+        calls.append(True)
+        return values[len(calls) - 1], validUntil
+
+    return build, calls
+
+
+def test_entity_cache_tiers(tmp_path):
+    workerA, workerB = entityCache(tmp_path), entityCache(tmp_path)
+    build, calls = builder({"name": "The Musical Hop"})
+    assert workerA.get("venue:1", build) == {"name": "The Musical Hop"}
+    assert workerA.get("venue:1", build) == {"name": "The Musical Hop"}
+    # Served from the shared file without building again
+    assert workerB.get("venue:1", build) == {"name": "The Musical Hop"}
+    assert len(calls) == 1
+
+
+def test_entity_cache_is_bypassed_without_a_listener(tmp_path):
+    cache = entityCache(tmp_path)
+    cache.live = False
+    build, calls = builder(1, 2)
+    assert (cache.get("venue:1", build), cache.get("venue:1", build)) == (1, 2)
+
+
+def test_invalidate_reaches_both_tiers(tmp_path):
+    workerA, workerB = entityCache(tmp_path), entityCache(tmp_path)
+    build, calls = builder("old", "new", "newer")
+    workerA.get("venue:1", build)
+    workerB.get("venue:1", build)
+    for worker in (workerA, workerB):
+        worker.invalidate("venue:1")
+    assert workerB.get("venue:1", build) == "new"
+    assert workerA.get("venue:1", build) == "new"
+    workerA.clear()
+    assert workerA.get("venue:1", build) == "newer"
+
+
+def test_stale_build_is_not_stored(tmp_path):
+    # Worker C builds from data read before a commit. A receives the NOTIFY
+    # meanwhile; C's own listener is behind and hasn't heard of it yet.
+    workerA, workerC = entityCache(tmp_path), entityCache(tmp_path)
+    fresh, freshCalls = builder("new", "new")
+
+    def staleBuild():
+        workerA.invalidate("venue:1")
+        return "old", None
+
+    assert workerC.get("venue:1", staleBuild) == "old"
+    assert workerA.get("venue:1", fresh) == "new"
+    assert workerC.get("venue:1", fresh) == "new"
+    assert len(freshCalls) == 1
+
+
+def test_value_read_before_a_local_invalidation_is_not_kept(tmp_path):
+    cache = entityCache(tmp_path)
+    cache.get("venue:1", builder("old")[0])
+    cache.entries.clear()
+
+    def invalidateDuringRead(*args):
+        cache.invalidate("venue:1")
+        return original(*args)
+
+    original = cache.remember
+    cache.remember = invalidateDuringRead
+    cache.get("venue:1", builder("unused")[0])
+    cache.remember = original
+    assert "venue:1" not in cache.entries
+
+
+def test_clear_beats_builds_in_flight(tmp_path):
+    workerA, workerB = entityCache(tmp_path), entityCache(tmp_path)
+
+    def staleBuild():
+        workerA.clear()
+        return "old", None
+
+    workerB.get("venue:1", staleBuild)
+    build, calls = builder("new")
+    assert workerA.get("venue:1", build) == "new"
+
+
+def test_entries_expire_at_valid_until(tmp_path):
+    cache = entityCache(tmp_path, ttl=300)
+    soon = time.time() + 60
+    cache.get("venue:1", builder("a", validUntil=soon)[0])
+    cache.get("venue:2", builder("b", validUntil=time.time() + 3600)[0])
+    expires = dict(cache.store().execute("SELECT key, expires FROM entities"))
+    assert expires["venue:1"] == soon
+    assert 290 < expires["venue:2"] - time.time() <= 300
+
+    build, calls = builder("before", "after", validUntil=time.time() - 1)
+    cache.get("venue:3", build)
+    assert cache.get("venue:3", build) == "after"
+
+
+def test_old_store_files_are_replaced(tmp_path):
+    path = tmp_path / "entities.sqlite3"
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        "CREATE TABLE entities "
+        "(key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)"
+    )
+    conn.execute("INSERT INTO entities VALUES ('venue:1', 1e12, '\"old\"')")
+    conn.commit()
+    conn.close()
+    assert entityCache(tmp_path).get("venue:1", builder("new")[0]) == "new"
+
+
+class FakeSearchCache:
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, namespace):
+        self.invalidated.append(namespace)
+
+
+def test_listener_payloads(tmp_path):
+    cache, searches = entityCache(tmp_path), FakeSearchCache()
+    listener = ChangeListener(None, None, cache, "fyyur_entity", searches)
+    cache.get("venue:1", builder("old")[0])
+    listener.invalidate("search:venues")
+    assert searches.invalidated == ["venues"]
+    assert "venue:1" in cache.entries
+    listener.invalidate("venue:1")
+    assert "venue:1" not in cache.entries
+    assert cache.get("venue:1", builder("new")[0]) == "new"
+    # Without a search cache, search payloads are ignored
+    ChangeListener(None, None, cache, "fyyur_entity").invalidate("search:artists")
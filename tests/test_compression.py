@@ -0,0 +1,120 @@
+import gzip
+import zlib
+
+from compression import CompressionMiddleware, chooseEncoding
+
+TYPES = {"text/html": {"gzip": 6, "br": 5}, "text/csv": {"gzip": 6}}
+
+
+def call(app, method="GET", acceptEncoding="gzip", types=TYPES):
+    middleware = CompressionMiddleware(app, types, minSize=1024)
+    response = {}
+
+    def startResponse(status, headers, exc_info=None):
+        response["status"] = status
+        response["headers"] = dict(headers)
+
+    environ = {"REQUEST_METHOD": method, "HTTP_ACCEPT_ENCODING": acceptEncoding}
+    chunks = list(middleware(environ, startResponse))
+    return response["headers"], chunks
+
+
+def page(body, contentType="text/html; charset=utf-8", status="200 OK", **extra):
+    def app(environ, start_response):
+        headers = [("Content-Type", contentType), ("Content-Length", str(len(body)))]
+        start_response(status, headers + list(extra.items()))
+        return [body]
+
+    return app
+
+
+def test_choose_encoding():
+    assert chooseEncoding("gzip, deflate") == "gzip"
+    assert chooseEncoding("gzip;q=0, identity") is None
+    assert chooseEncoding("*") == "gzip"
+    assert chooseEncoding("") is None
+
+
+def test_large_bodies_are_compressed():
+    body = b"<li>Venue</li>" * 500
+    headers, chunks = call(page(body))
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert int(headers["Content-Length"]) == len(b"".join(chunks))
+    assert gzip.decompress(b"".join(chunks)) == body
+
+
+def test_passes_through():
+    body = b"x" * 5000
+    cases = [
+        (page(b"small"), {}),
+        (page(body), {"acceptEncoding": "identity"}),
+        (page(body), {"method": "HEAD"}),
+        (page(body, contentType="image/png"), {}),
+        (page(body, status="204 No Content"), {}),
+        (page(body, **{"Content-Encoding": "br"}), {}),
+        (page(body, **{"Cache-Control": "no-transform"}), {}),
+    ]
+    for app, options in cases:
+        headers, chunks = call(app, **options)
+        assert headers.get("Content-Encoding") in (None, "br")
+        assert b"".join(chunks) in (body, b"small")
+
+
+def test_type_without_a_level_for_the_encoding_passes_through():
+    body = b"a,b\n" * 1000
+    headers, chunks = call(page(body, contentType="text/csv"), types={"text/csv": {}})
+    assert "Content-Encoding" not in headers
+    assert b"".join(chunks) == body
+
+
+def test_streamed_bodies_are_flushed_per_chunk():
+    rows = [b"%d,row\n" % number for number in range(2000)]
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/csv")])
+        return iter(rows)
+
+    headers, chunks = call(app)
+    assert headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in headers
+    decompressor = zlib.decompressobj(31)
+    received = b""
+    for chunk in chunks[:-1]:
+        # Every chunk decompresses on its own, without waiting for the end
+        received += decompressor.decompress(chunk)
+        assert b"".join(rows).startswith(received)
+    received += decompressor.decompress(chunks[-1]) + decompressor.flush()
+    assert received == b"".join(rows)
+
+
+def test_write_callable():
+    def app(environ, start_response):
+        write = start_response("200 OK", [("Content-Type", "text/html")])
+        write(b"<p>written</p>" * 200)
+        return [b"<p>returned</p>"]
+
+    expected = b"<p>written</p>" * 200 + b"<p>returned</p>"
+    headers, chunks = call(app)
+    assert gzip.decompress(b"".join(chunks)) == expected
+    headers, chunks = call(app, acceptEncoding="")
+    assert b"".join(chunks) == expected
+
+
+def test_uncompressed_responses_still_vary():
+    body = b"<li>Venue</li>" * 500
+    for options in (
+        {"acceptEncoding": ""},
+        {"acceptEncoding": "identity"},
+        {"types": {"text/html": {"br": 5}}},
+    ):
+        headers, chunks = call(page(body), **options)
+        assert "Content-Encoding" not in headers
+        assert headers["Vary"] == "Accept-Encoding"
+    headers, chunks = call(page(b"small"))
+    assert headers["Vary"] == "Accept-Encoding"
+    headers, chunks = call(page(body, Vary="Cookie"), acceptEncoding="")
+    assert headers["Vary"] == "Cookie, Accept-Encoding"
+    # Types that are never compressed don't vary
+    headers, chunks = call(page(body, contentType="image/png"))
+    assert "Vary" not in headers
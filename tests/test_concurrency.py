@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import Artist, db
+from tests.factories import addArtist
+
+
+def test_concurrent_edits_lose_no_updates(app, fileDatabase, fullSize):
+    # Every round, all threads submit the edit form rendered from the same
+    # version: exactly one may win and the rest must get the conflict page
+    threads, rounds = (16, 50) if fullSize else (8, 5)
+    artistId = addArtist().id
+    barrier = threading.Barrier(threads, timeout=60)
+    outcomes = []
+
+    def edit(number):
+        client = app.test_client()
+        for roundNumber in range(rounds):
+            barrier.wait()
+            response = client.post(
+                f"/artists/{artistId}/edit",
+                data={
+                    "version": str(roundNumber + 1),
+                    "name": f"Editor {number} round {roundNumber}",
+                    "city": "San Francisco",
+                    "state": "CA",
+                },
+            )
+            won = response.location.endswith(f"/artists/{artistId}")
+            outcomes.append((roundNumber, number, won))
+            # Nobody starts the next round before every edit of this one is in
+            barrier.wait()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        for future in [pool.submit(edit, number) for number in range(threads)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    winners = {}
+    for roundNumber, number, won in outcomes:
+        if won:
+            assert roundNumber not in winners, f"two edits won round {roundNumber}"
+            winners[roundNumber] = number
+    assert sorted(winners) == list(range(rounds))
+    db.session.expire_all()
+    artist = Artist.query.get(artistId)
+    assert artist.version == rounds + 1
+    assert artist.name == f"Editor {winners[rounds - 1]} round {rounds - 1}"
+    print(
+        f"\nconcurrent edits: threads={threads}, rounds={rounds}, "
+        f"requests_per_s={round(len(outcomes) / elapsed)}"
+    )
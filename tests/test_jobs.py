@@ -0,0 +1,129 @@
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import jobs
+from app import Job, db, jobQueue, startJobQueue
+
+calls = []
+
+
+@jobs.job("test_record")
+def recordCall(value):
+    calls.append(value)
+
+
+@jobs.job("test_fail")
+def fail():
+    raise ValueError("boom")
+
+
+def finished(error=None):
+    future = Future()
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+    return future
+
+
+def runOnce(future):
+    # What the dispatcher does for one job, without its threads
+    jobQueue.slots.acquire()
+    jobId, name, payload = jobQueue.claim()
+    jobQueue.complete(jobId, future)
+    return Job.query.get(jobId)
+
+
+def makeDue(jobId):
+    Job.query.filter_by(id=jobId).update({"run_after": datetime.utcnow()})
+    db.session.commit()
+
+
+def test_claim_and_complete(app, monkeypatch):
+    monkeypatch.setattr(jobQueue, "slots", threading.Semaphore(1), raising=False)
+    laterId = jobQueue.enqueue("test_record", {"value": 2}, delay=60).id
+    jobId = jobQueue.enqueue("test_record", {"value": 1}).id
+    assert jobQueue.claim() == (jobId, "test_record", {"value": 1})
+    assert Job.query.get(jobId).status == "running"
+    assert Job.query.get(jobId).attempts == 1
+    # Nothing else is due yet
+    assert jobQueue.claim() is None
+    jobQueue.complete(jobId, finished())
+    record = Job.query.get(jobId)
+    assert record.status == "done"
+    assert Job.query.get(laterId).status == "queued"
+
+
+def test_retries_with_backoff_then_fails(app, monkeypatch):
+    monkeypatch.setattr(jobQueue, "slots", threading.Semaphore(1), raising=False)
+    jobId = jobQueue.enqueue("test_fail", max_attempts=3).id
+    for attempt, backoff in ((1, 2), (2, 4)):
+        started = datetime.utcnow()
+        record = runOnce(finished(ValueError("boom")))
+        assert (record.status, record.attempts) == ("queued", attempt)
+        assert "boom" in record.last_error
+        delay = (record.run_after - started).total_seconds()
+        assert backoff - 1 < delay < backoff + 1
+        assert jobQueue.claim() is None
+        makeDue(jobId)
+    record = runOnce(finished(ValueError("boom")))
+    assert (record.status, record.attempts) == ("failed", 3)
+    makeDue(jobId)
+    assert jobQueue.claim() is None
+
+
+def test_recover_requeues_stale_running_jobs(app):
+    stale = datetime.utcnow() - timedelta(seconds=app.config["JOB_LEASE"] + 60)
+    db.session.add_all(
+        [
+            Job(id=1, name="test_record", status="running", updated_at=stale),
+            Job(id=2, name="test_record", status="running"),
+            Job(id=3, name="test_record", status="done", updated_at=stale),
+        ]
+    )
+    db.session.commit()
+    jobQueue.recover()
+    statuses = {record.id: record.status for record in Job.query}
+    assert statuses == {1: "queued", 2: "running", 3: "done"}
+
+
+def test_workers_run_queued_jobs(app, fileDatabase, monkeypatch):
+    monkeypatch.setitem(app.config, "JOB_POLL_INTERVAL", 0.01)
+    calls.clear()
+    jobIds = [jobQueue.enqueue("test_record", {"value": n}).id for n in range(5)]
+    jobQueue.start()
+    try:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            db.session.remove()
+            if all(Job.query.get(jobId).status == "done" for jobId in jobIds):
+                break
+            time.sleep(0.02)
+    finally:
+        jobQueue.shutdown()
+    assert sorted(calls) == list(range(5))
+    assert all(Job.query.get(jobId).status == "done" for jobId in jobIds)
+
+
+def test_autostart_waits_for_the_first_request(app, monkeypatch):
+    started = []
+    monkeypatch.setattr(jobQueue, "start", lambda: started.append(True))
+    assert startJobQueue in app.before_first_request_funcs
+    monkeypatch.setitem(app.config, "JOB_QUEUE_AUTOSTART", False)
+    startJobQueue()
+    assert started == []
+    monkeypatch.setitem(app.config, "JOB_QUEUE_AUTOSTART", True)
+    startJobQueue()
+    assert started == [True]
+
+
+def test_job_status(client):
+    record = jobQueue.enqueue("test_record", {"value": 1}, max_attempts=5)
+    data = client.get(f"/jobs/{record.id}").get_json()
+    assert data["name"] == "test_record"
+    assert data["status"] == "queued"
+    assert (data["attempts"], data["max_attempts"]) == (0, 5)
+    assert data["last_error"] is None
+    assert client.get("/jobs/999").status_code == 404
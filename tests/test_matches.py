@@ -0,0 +1,107 @@
+import json
+from datetime import datetime, timedelta
+
+import jobs
+from app import (
+    GenreType,
+    Job,
+    Match,
+    db,
+    insertMatches,
+    matchingArtists,
+    matchingVenues,
+    refreshArtistMatches,
+    refreshVenueMatches,
+)
+from tests.factories import addArtist, addShow, addVenue
+
+jazz, rock, folk = GenreType.jazz, GenreType.rock_n_roll, GenreType.folk
+
+
+def runQueuedJobs():
+    queued = Job.query.filter_by(name="refresh_matches").all()
+    queued = [(record.id, json.loads(record.payload)) for record in queued]
+    for jobId, payload in queued:
+        # _execute runs the handler in its own app context, as a worker does
+        jobs._execute("refresh_matches", payload)
+        Job.query.filter_by(id=jobId).delete()
+    db.session.commit()
+
+
+def test_artist_matches_are_filtered_and_ranked(app):
+    artist = addArtist(genres=[jazz, rock])
+    oneGenre = addVenue(name="One genre", genres=[jazz])
+    twoGenres = addVenue(name="Two genres", genres=[jazz, rock])
+    busy = addVenue(name="Busy", genres=[rock])
+    addShow(addArtist(name="Other"), busy, datetime.now() - timedelta(days=10))
+    addVenue(name="Elsewhere", city="Oakland", genres=[jazz])
+    addVenue(name="Other state", state="NY", genres=[jazz])
+    addVenue(name="Not seeking", seeking_talent=False, genres=[jazz])
+    addVenue(name="No overlap", genres=[folk])
+    refreshArtistMatches(artist.id)
+    db.session.commit()
+    ranked = [(row.name, row.genre_overlap) for row in matchingVenues(artist.id)]
+    # More shared genres first, then the venue with more recent shows
+    assert ranked == [("Two genres", 2), ("Busy", 1), ("One genre", 1)]
+    assert {row.id for row in matchingVenues(artist.id)} == {
+        oneGenre.id,
+        twoGenres.id,
+        busy.id,
+    }
+
+
+def test_venue_matches(app):
+    venue = addVenue(genres=[jazz])
+    match = addArtist(name="Match")
+    addArtist(name="Not seeking", seeking_venue=False)
+    addArtist(name="No overlap", genres=[folk])
+    refreshVenueMatches(venue.id)
+    db.session.commit()
+    assert [row.id for row in matchingArtists(venue.id)] == [match.id]
+
+
+def test_edit_queues_a_refresh(client):
+    artist = addArtist(genres=[folk])
+    venue = addVenue(genres=[jazz])
+    artistId, venueId = artist.id, venue.id
+    runQueuedJobs()
+    assert matchingVenues(artistId) == []
+    response = client.post(
+        f"/artists/{artistId}/edit",
+        data={
+            "version": "1",
+            "name": "Guns N Petals",
+            "city": "San Francisco",
+            "state": "CA",
+            "genres": ["Jazz"],
+        },
+    )
+    assert response.status_code == 302
+    payloads = [json.loads(record.payload) for record in Job.query]
+    assert payloads == [{"artists": [artistId], "venues": []}]
+    runQueuedJobs()
+    assert [row.id for row in matchingVenues(artistId)] == [venueId]
+
+    page = client.get(f"/artists/{artistId}").get_data(as_text=True)
+    assert "Venues Seeking Talent Like This" in page
+    assert f'href="/venues/{venueId}"' in page
+    assert "1 shared genre" in page
+    page = client.get(f"/venues/{venueId}").get_data(as_text=True)
+    assert f'href="/artists/{artistId}"' in page
+
+
+def test_overlapping_refreshes_insert_each_pair_once(app):
+    # An artist refresh and a venue refresh in the same city each delete
+    # their own rows, then both insert the same pair
+    artist = addArtist(genres=[jazz])
+    venue = addVenue(genres=[jazz])
+    refreshArtistMatches(artist.id)
+    insertMatches([(artist.id, venue.id, [jazz], [jazz])])
+    db.session.commit()
+    assert Match.query.count() == 1
+    refreshVenueMatches(venue.id)
+    refreshArtistMatches(artist.id)
+    db.session.commit()
+    assert [(row.artist_id, row.venue_id) for row in Match.query] == [
+        (artist.id, venue.id)
+    ]
@@ -0,0 +1,45 @@
+from sqlalchemy import text
+
+from app import GENRE_BITS, GenreType, Venue, db, hasGenre
+from tests.factories import addVenue
+
+
+def reload(venue):
+    venueId = venue.id
+    db.session.expunge_all()
+    return Venue.query.get(venueId)
+
+
+def test_genres_round_trip(app):
+    genres = [GenreType.jazz, GenreType.r_b, GenreType.rock_n_roll]
+    venue = addVenue(genres=genres)
+    assert reload(venue).genres == genres
+
+
+def test_genres_are_stored_as_a_bitmask(app):
+    venue = addVenue(genres=[GenreType.jazz, GenreType.hip_hop])
+    stored = db.session.execute(
+        text('SELECT genres FROM "Venue" WHERE id = :id'), {"id": venue.id}
+    ).scalar()
+    assert stored == GENRE_BITS[GenreType.jazz] | GENRE_BITS[GenreType.hip_hop]
+
+
+def test_empty_and_missing_genres(app):
+    assert reload(addVenue(genres=[])).genres == []
+    assert reload(addVenue(genres=None)).genres is None
+
+
+def test_genres_accept_enum_names(app):
+    assert reload(addVenue(genres=["folk", "swing"])).genres == [
+        GenreType.swing,
+        GenreType.folk,
+    ]
+
+
+def test_has_genre(app):
+    jazz = addVenue(name="Jazz Club", genres=[GenreType.jazz])
+    both = addVenue(name="Both", genres=[GenreType.jazz, GenreType.folk])
+    addVenue(name="Folk Hall", genres=[GenreType.folk])
+    addVenue(name="Nothing", genres=None)
+    found = Venue.query.filter(hasGenre(Venue.genres, GenreType.jazz))
+    assert sorted(venue.id for venue in found) == [jazz.id, both.id]
@@ -0,0 +1,85 @@
+import os
+
+from itsdangerous import URLSafeTimedSerializer
+from itsdangerous.timed import TimestampSigner
+
+from app import profiler
+from profiling import categorize
+
+
+def profiles(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".folded"))
+
+
+def profileDir(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiler, "directory", str(tmp_path))
+    monkeypatch.setitem(app.config, "PROFILE_ENABLED", False)
+    return tmp_path
+
+
+def test_signed_token_profiles_the_request(app, client, monkeypatch, tmp_path):
+    directory = profileDir(app, monkeypatch, tmp_path)
+    response = client.get("/", query_string={"_profile": profiler.token()})
+    assert response.status_code == 200
+    assert len(profiles(directory)) == 1
+
+
+def test_tampered_or_expired_tokens_are_rejected(app, client, monkeypatch, tmp_path):
+    directory = profileDir(app, monkeypatch, tmp_path)
+    payload, timestamp, signature = profiler.token().split(".")
+    # Same signature on a different payload; editing the signature's last
+    # character may only change padding bits
+    tampered = ".".join(["InRva2VuIg", timestamp, signature])
+    forged = URLSafeTimedSerializer("not the secret", salt="fyyur-profile").dumps(
+        "profile"
+    )
+    maxAge = app.config["PROFILE_TOKEN_MAX_AGE"]
+    now = TimestampSigner.get_timestamp
+    with monkeypatch.context() as patch:
+        patch.setattr(
+            TimestampSigner, "get_timestamp", lambda self: now(self) - maxAge - 60
+        )
+        expired = profiler.token()
+    # Only its age is wrong with it
+    assert profiler.serializer.loads(expired) == "profile"
+    for bad in (tampered, forged, expired, "profile"):
+        with app.test_request_context("/", query_string={"_profile": bad}):
+            assert not profiler.wanted()
+        assert client.get("/", query_string={"_profile": bad}).status_code == 200
+    assert profiles(directory) == []
+
+
+def test_categorize():
+    view = "/srv/fyyur/app.py"
+    query = "/usr/lib/python3/site-packages/sqlalchemy/orm/query.py"
+    jinja = "/usr/lib/python3/site-packages/jinja2/environment.py"
+    template = "templates/pages/shows.html"
+    assert categorize([view]) == "python"
+    assert categorize([view, query]) == "sql"
+    assert categorize([view, jinja, template]) == "render"
+    # A query issued while rendering counts as SQL time
+    assert categorize([view, jinja, template, query]) == "sql"
+    assert categorize([]) == "python"
+
+
+def writeProfiles(directory, sizes):
+    for age, size in enumerate(sizes):
+        path = directory / f"{age}.folded"
+        path.write_text("x" * size)
+        # Older profiles have lower numbers
+        os.utime(path, (1000 + age, 1000 + age))
+    (directory / "notes.txt").write_text("kept")
+
+
+def test_prune_keeps_the_newest_profiles(app, monkeypatch, tmp_path):
+    profileDir(app, monkeypatch, tmp_path)
+    monkeypatch.setitem(app.config, "PROFILE_MAX_FILES", 3)
+    monkeypatch.setitem(app.config, "PROFILE_MAX_BYTES", 10000)
+    writeProfiles(tmp_path, [10] * 5)
+    profiler.prune()
+    assert profiles(tmp_path) == ["2.folded", "3.folded", "4.folded"]
+
+    monkeypatch.setitem(app.config, "PROFILE_MAX_BYTES", 25)
+    profiler.prune()
+    assert profiles(tmp_path) == ["3.folded", "4.folded"]
+    assert (tmp_path / "notes.txt").exists()
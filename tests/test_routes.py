@@ -0,0 +1,253 @@
+from datetime import datetime
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app import Artist, GenreType, Show, Venue, admission
+from tests.factories import addArtist, addShow, addVenue
+
+
+def test_index(client):
+    assert client.get("/").status_code == 200
+
+
+def test_health_checks(client):
+    assert client.get("/healthz").get_json() == {"status": "ok"}
+    assert client.get("/readyz").status_code == 200
+
+
+def test_venues_are_grouped_by_city(client):
+    addVenue(name="The Musical Hop")
+    addVenue(name="Park Square", city="New York", state="NY")
+    response = client.get("/venues")
+    assert response.status_code == 200
+    assert b"San Francisco, CA" in response.data
+    assert b"New York, NY" in response.data
+
+
+def test_venue_page(client):
+    venue = addVenue()
+    addShow(addArtist(), venue)
+    addShow(addArtist(name="Matt Quevado"), venue, datetime(2019, 6, 15, 23))
+    response = client.get(f"/venues/{venue.id}")
+    assert response.status_code == 200
+    assert b"Guns N Petals" in response.data
+    assert b"Matt Quevado" in response.data
+
+
+def test_missing_pages_are_404(client):
+    assert client.get("/venues/99").status_code == 404
+    assert client.get("/artists/99").status_code == 404
+
+
+def test_artist_page(client):
+    artist = addArtist(genres=[GenreType.rock_n_roll])
+    response = client.get(f"/artists/{artist.id}")
+    assert response.status_code == 200
+    assert b"Rock n Roll" in response.data
+
+
+def test_search_ignores_case_and_spacing(client):
+    addArtist(name="Guns N Petals")
+    addArtist(name="The Wild Sax Band")
+    for term in ("GUNS  ", "guns"):
+        response = client.post("/artists/search", data={"search_term": term})
+        assert b"Guns N Petals" in response.data
+        assert b"The Wild Sax Band" not in response.data
+
+
+def test_search_sees_new_venues(client):
+    addVenue(name="The Dueling Pianos Bar")
+    client.post("/venues/search", data={"search_term": "hop"})
+    addVenue(name="The Musical Hop")
+    response = client.post("/venues/search", data={"search_term": "hop"})
+    assert b"The Musical Hop" in response.data
+
+
+def test_shows_filters(client):
+    artist = addArtist()
+    addShow(artist, addVenue(), datetime(2035, 1, 10))
+    addShow(
+        artist, addVenue(name="Park Square", city="New York"), datetime(2035, 2, 10)
+    )
+    assert client.get("/shows").data.count(b"tile-show") == 2
+    response = client.get("/shows?from=2035-02-01&to=2035-03-01")
+    assert response.data.count(b"tile-show") == 1
+    assert client.get("/shows?city=new york").data.count(b"tile-show") == 1
+    assert client.get("/shows?city=%25").data.count(b"tile-show") == 0
+    assert client.get("/shows?from=garbage").status_code == 400
+
+
+def test_edit_artist(client):
+    artist = addArtist()
+    response = client.post(
+        f"/artists/{artist.id}/edit",
+        data={
+            "version": "1",
+            "name": "Guns N Roses",
+            "city": "Oakland",
+            "state": "CA",
+            "genres": ["Jazz", "Folk"],
+        },
+    )
+    assert response.status_code == 302
+    assert response.location.endswith(f"/artists/{artist.id}")
+    edited = Artist.query.get(artist.id)
+    assert (edited.name, edited.version) == ("Guns N Roses", 2)
+    assert edited.genres == [GenreType.jazz, GenreType.folk]
+
+
+def test_edit_with_stale_version_is_rejected(client):
+    venue = addVenue()
+    data = {
+        "version": "1",
+        "name": "Renamed",
+        "city": "Oakland",
+        "state": "CA",
+        "address": "1015 Folsom Street",
+    }
+    response = client.post(f"/venues/{venue.id}/edit", data=data)
+    assert response.location.endswith(f"/venues/{venue.id}")
+    response = client.post(f"/venues/{venue.id}/edit", data=dict(data, name="Lost"))
+    assert response.location.endswith(f"/venues/{venue.id}/edit")
+    assert Venue.query.get(venue.id).name == "Renamed"
+
+
+def test_delete_venue_cascades_to_shows(client):
+    venue = addVenue()
+    addShow(addArtist(), venue)
+    venueId = venue.id
+    response = client.delete(f"/venues/{venueId}")
+    assert response.status_code == 303
+    assert Venue.query.get(venueId) is None
+    assert Show.query.count() == 0
+    assert client.delete(f"/venues/{venueId}").status_code == 404
+
+
+def test_calendar(client):
+    venue = addVenue()
+    addShow(addArtist(), venue)
+    response = client.get(f"/venues/{venue.id}/shows.ics")
+    assert response.mimetype == "text/calendar"
+    lines = response.get_data(as_text=True).split("\r\n")
+    assert lines[0] == "BEGIN:VCALENDAR"
+    assert all(len(line.encode()) <= 75 for line in lines)
+
+
+def test_export(client):
+    venue = addVenue()
+    artist = addArtist()
+    first = addShow(artist, venue)
+    second = addShow(artist, venue)
+    rows = client.get("/export/shows.csv").get_data(as_text=True).splitlines()
+    assert len(rows) == 3
+    lines = client.get(f"/export/shows.jsonl?after={first.id}").data.splitlines()
+    assert len(lines) == 1 and str(second.id).encode() in lines[0]
+    assert client.get("/export/shows.xml").status_code == 404
+
+
+def test_available_venues(client):
+    busy = addVenue(name="Busy")
+    addVenue(name="Free", genres=[GenreType.folk])
+    addVenue(name="Elsewhere", city="New York", state="NY")
+    addShow(addArtist(), busy, datetime(2035, 6, 1, 20))
+    response = client.get(
+        "/venues/available?city=San Francisco&from=2035-06-01&to=2035-06-02"
+    )
+    assert b"Free" in response.data
+    assert b"Busy" not in response.data
+    assert b"Elsewhere" not in response.data
+    response = client.get("/venues/available?from=2035-06-01&to=2035-06-02&genre=Jazz")
+    assert b"Elsewhere" in response.data
+    assert b">Free<" not in response.data
+    response = client.get("/venues/available?from=2035-06-02&to=2035-06-01")
+    assert response.status_code == 400
+
+
+def test_available_venues_mixes_naive_and_aware_times(client):
+    busy = addVenue(name="Busy")
+    addShow(addArtist(), busy, datetime(2035, 6, 1, 20))
+    # 21:00+02:00 is 19:00 UTC, before the show
+    response = client.get(
+        "/venues/available",
+        query_string={"from": "2035-06-01T21:00+02:00", "to": "2035-06-02"},
+    )
+    assert response.status_code == 200
+    assert b"Busy" not in response.data
+    response = client.get(
+        "/venues/available",
+        query_string={"from": "2035-06-01T21:00Z", "to": "2035-06-02"},
+    )
+    assert b"Busy" in response.data
+
+
+def test_batch(client):
+    venue = addVenue()
+    artist = addArtist(genres=[GenreType.swing])
+    show = addShow(artist, venue)
+    data = client.get(
+        f"/api/v1/batch?artists={artist.id},999&venues={venue.id}&shows={show.id}"
+    ).get_json()
+    assert data["artists"] == {
+        str(artist.id): {
+            "id": artist.id,
+            "name": "Guns N Petals",
+            "city": "San Francisco",
+            "state": "CA",
+            "genres": ["Swing"],
+            "image_link": None,
+        }
+    }
+    assert data["venues"][str(venue.id)]["name"] == "The Musical Hop"
+    assert data["shows"][str(show.id)]["venue_id"] == venue.id
+    assert client.get("/api/v1/batch?artists=1,x").status_code == 400
+    ids = ",".join(str(number) for number in range(301))
+    assert client.get(f"/api/v1/batch?venues={ids}").status_code == 400
+
+
+def test_metrics(client):
+    response = client.get("/metrics")
+    assert response.headers["Content-Type"].count("charset") == 1
+    assert b"fyyur_request_duration_seconds" in response.data
+
+
+@pytest.fixture
+def limitShows(app, monkeypatch):
+    # A single slot on /shows; waiters give up after 50ms instead of 2s
+    def limit(queue):
+        limits = dict(app.config["ADMISSION_LIMITS"])
+        limits["shows"] = {"concurrency": 1, "queue": queue, "timeout": 0.05}
+        monkeypatch.setitem(app.config, "ADMISSION_LIMITS", limits)
+        admission.configure(app.config)
+        return admission.limiters["shows"]
+
+    yield limit
+    monkeypatch.undo()
+    admission.configure(app.config)
+
+
+def shedCount(reason):
+    sample = REGISTRY.get_sample_value(
+        "fyyur_admission_shed_total", {"endpoint": "shows", "reason": reason}
+    )
+    return sample or 0
+
+
+@pytest.mark.parametrize("queue, reason", [(1, "timeout"), (0, "queue_full")])
+def test_saturated_route_is_shed(client, limitShows, queue, reason):
+    showsLimiter = limitShows(queue)
+    before = shedCount(reason)
+    assert showsLimiter.slots.acquire(blocking=False)
+    try:
+        response = client.get("/shows")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(
+            client.application.config["ADMISSION_RETRY_AFTER"]
+        )
+        assert shedCount(reason) == before + 1
+        # Routes without a limit, or with free slots, are unaffected
+        assert client.get("/").status_code == 200
+        assert client.get("/venues").status_code == 200
+    finally:
+        showsLimiter.release()
+    assert client.get("/shows").status_code == 200
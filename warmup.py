@@ -0,0 +1,131 @@
+"""Health, readiness and start-up warm-up.
+
+/healthz answers as soon as the process can serve requests. /readyz answers
+503 until the warm-up has finished, so a load balancer only routes traffic to
+workers that have opened their connections, compiled their templates and
+loaded the WARMUP_PATHS pages once. Those pages don't read the search or
+entity caches, so the warm-up leaves both caches empty.
+
+The warm-up starts on a process's first request (normally the first /readyz
+probe), so it only runs in processes that serve requests and, under a
+pre-forking server, in each worker after the fork. CLI commands such as
+``flask db upgrade`` import the app but never start it.
+"""
+
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+class Readiness:
+    def __init__(self, app=None, db=None):
+        self.ready = threading.Event()
+        self.steps = {}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.add_url_rule("/healthz", "healthz", self.healthz)
+        app.add_url_rule("/readyz", "readyz", self.readyz)
+        app.before_first_request(self.start)
+
+    def healthz(self):
+        return jsonify({"status": "ok"})
+
+    def readyz(self):
+        if not self.ready.is_set():
+            return jsonify({"status": "warming", "steps": self.steps}), 503
+        return jsonify({"status": "ready", "steps": self.steps})
+
+    def start(self):
+        """Warm up in the background, or report ready at once if disabled."""
+        if not self.app.config["WARMUP_ON_START"]:
+            self.ready.set()
+            return
+        threading.Thread(target=self.run, name="fyyur-warmup", daemon=True).start()
+
+    def run(self):
+        # Keep retrying (e.g. while the database is still coming up); the
+        # worker stays out of rotation until every step has succeeded once
+        delay = 1
+        while not self.ready.is_set():
+            try:
+                self.warmUp()
+            except Exception:
+                self.app.logger.exception("Warm-up failed, retrying in %ss", delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            else:
+                self.ready.set()
+
+    def warmUp(self):
+        for name, step in (
+            ("pool", self.primePool),
+            ("types", self.loadTypes),
+            ("templates", self.compileTemplates),
+            ("pages", self.preloadPages),
+            ("indexes", self.prewarmIndexes),
+        ):
+            started = time.perf_counter()
+            step()
+            self.steps[name] = round(time.perf_counter() - started, 3)
+        self.app.logger.info("Warm-up finished: %s", self.steps)
+
+    def primePool(self):
+        # Open the pool's connections up front instead of on first requests
+        with self.app.app_context():
+            connections = [
+                self.db.engine.raw_connection()
+                for _ in range(self.app.config["WARMUP_POOL_CONNECTIONS"])
+            ]
+            for connection in connections:
+                connection.close()
+
+    def loadTypes(self):
+        # Configures the mappers and runs each model's query once, which
+        # also resolves the genre_type enum on PostgreSQL
+        with self.app.app_context():
+            for model in self.db.Model.__subclasses__():
+                self.db.session.query(model).limit(1).all()
+            self.db.session.rollback()
+
+    def compileTemplates(self):
+        # Fills the in-memory template cache (and the bytecode cache on disk)
+        env = self.app.jinja_env
+        for name in env.list_templates(extensions=["html"]):
+            env.get_template(name)
+
+    def preloadPages(self):
+        client = self.app.test_client()
+        for path in self.app.config["WARMUP_PATHS"]:
+            response = client.get(path)
+            if response.status_code >= 500:
+                raise RuntimeError(f"Warm-up request {path} failed")
+
+    def prewarmIndexes(self):
+        relations = self.app.config["WARMUP_RELATIONS"]
+        with self.app.app_context():
+            if not relations or self.db.engine.dialect.name != "postgresql":
+                return
+            with self.db.engine.connect() as conn:
+                installed = conn.execute(
+                    text("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+                ).scalar()
+            if not installed:
+                return
+            for relation in relations:
+                # Optional: a relation that can't be prewarmed doesn't block
+                # readiness
+                try:
+                    with self.db.engine.connect() as conn:
+                        conn.execute(
+                            text("SELECT pg_prewarm(CAST(:relation AS regclass))"),
+                            {"relation": f'"{relation}"'},
+                        )
+                except SQLAlchemyError:
+                    self.app.logger.warning("Could not prewarm %s", relation)